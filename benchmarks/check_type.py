@@ -0,0 +1,32 @@
+"""Time type checks of assignments between common types.
+
+Usage: python -m benchmarks.check_type
+"""
+
+import timeit
+
+from porcupy.ast import Slot
+from porcupy.gameobjs import Yozhik
+from porcupy.types import BoolType, FloatType, IntType, ListPointer, NumberType, check_type
+
+
+def main():
+    pairs = [
+        ('int <- bool', IntType(), BoolType()),
+        ('number <- float', NumberType(), FloatType()),
+        ('list <- list', ListPointer(IntType(), 5), ListPointer(IntType(), 5)),
+        ('yozhik <- yozhik', Yozhik(), Yozhik()),
+    ]
+    number = 100000
+    for name, dest_type, src_type in pairs:
+        dest = Slot('p', 1, 'z', dest_type)
+        src = Slot('p', 2, 'z', src_type)
+        seconds = min(timeit.repeat(lambda: check_type(dest, src), number=number, repeat=5))
+        print('{:<18} {:6.3f} us'.format(name, seconds / number * 1e6))
+
+    seconds = min(timeit.repeat(lambda: ListPointer(IntType(), 5), number=number, repeat=5))
+    print('{:<18} {:6.3f} us'.format('new list type', seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main()
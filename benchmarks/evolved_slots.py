@@ -0,0 +1,39 @@
+"""Compile the playground scenarios that access attributes of game
+objects and time accesses to fields of evolved slots.
+
+Usage: python -m benchmarks.evolved_slots [REPEAT]
+"""
+
+import os
+import sys
+import timeit
+
+from porcupy.ast import EvolvedSlot, Slot
+from porcupy.compiler import compile
+from porcupy.types import IntType
+
+PLAYGROUND = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'playground')
+SCENARIOS = ['arcanoid.py', 'radial_calc.py', 'radial_calc2.py', 'volleybot.py']
+
+
+def main(argv):
+    repeat = int(argv[1]) if len(argv) > 1 else 20
+
+    for name in SCENARIOS:
+        path = os.path.join(PLAYGROUND, name)
+        with open(path) as fp:
+            source = fp.read()
+        seconds = min(timeit.repeat(lambda: compile(source, path), number=1, repeat=repeat))
+        print('{:<16} {:7.2f} ms'.format(name, seconds * 1000))
+
+    slot = Slot('p', 1, 'z', IntType())
+    evolved = EvolvedSlot(EvolvedSlot(EvolvedSlot(slot, register='e', ref=True), attrib='x'), short_form=False)
+    number = 100000
+    for stmt in ['evolved.index', 'evolved.type', 'evolved.attrib', 'str(evolved)',
+                 'EvolvedSlot(evolved, type=None)']:
+        seconds = min(timeit.repeat(stmt, number=number, repeat=5, globals=dict(globals(), evolved=evolved)))
+        print('{:<32} {:7.3f} us'.format(stmt, seconds / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
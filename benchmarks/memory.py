@@ -0,0 +1,39 @@
+"""Measure memory taken by the compiled tree of a large generated program.
+
+Usage: python -m benchmarks.memory [STATEMENTS]
+"""
+
+import gc
+import sys
+import tracemalloc
+
+from porcupy.compiler import compile_module
+
+
+def generate(statements):
+    lines = ['x = 0', 'y = 1', 'z = 2.5', 'b = False']
+    for i in range(statements // 4):
+        lines.append('x = x + {} * y'.format(i))
+        lines.append('b = x > {} and y < 10'.format(i))
+        lines.append('yozhiks[1].speed_x = x % 7')
+        lines.append('z = z / 2 + yozhiks[2].speed_y')
+    return '\n'.join(lines)
+
+
+def main(argv):
+    statements = int(argv[1]) if len(argv) > 1 else 20000
+    source = generate(statements)
+
+    gc.collect()
+    tracemalloc.start()
+    module = compile_module(source, '<benchmark>', opt_level=0, passes=None)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print('statements: {}'.format(len(module.body)))
+    print('retained:   {:.1f} MiB'.format(retained / 2**20))
+    print('peak:       {:.1f} MiB'.format(peak / 2**20))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
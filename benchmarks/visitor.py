@@ -0,0 +1,28 @@
+"""Measure how fast the converter visits nodes of a large generated
+program.
+
+Usage: python -m benchmarks.visitor [STATEMENTS]
+"""
+
+import ast
+import sys
+import timeit
+
+from porcupy.compiler import NodeConverter
+
+from .memory import generate
+
+
+def main(argv):
+    statements = int(argv[1]) if len(argv) > 1 else 20000
+    tree = ast.parse(generate(statements))
+    nodes = sum(1 for _ in ast.walk(tree))
+
+    seconds = min(timeit.repeat(lambda: NodeConverter().visit(tree), number=1, repeat=5))
+    print('nodes:   {}'.format(nodes))
+    print('time:    {:.3f} s'.format(seconds))
+    print('nodes/s: {:.0f}'.format(nodes / seconds))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
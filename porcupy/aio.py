@@ -0,0 +1,186 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import attr
+
+from .compiler import compile, compile_module
+from .emitter import iter_pieces
+
+DEFAULT_LIMIT = 4
+
+_default_compiler = None
+
+
+@attr.s
+class AsyncCompiler:
+    """Compile scenarios in worker threads without blocking the event
+    loop.
+
+    At most *limit* compilations run at the same time, the rest wait for
+    their turn. A compilation that times out or whose task is cancelled
+    stops before converting its next statement, and frees its worker.
+
+    The module uses ``async`` and ``await``, so it needs Python 3.5 or
+    newer.
+    """
+
+    limit = attr.ib(default=DEFAULT_LIMIT)
+
+    _executor = attr.ib(init=False)
+    _semaphores = attr.ib(default=attr.Factory(dict), init=False)
+
+    def __attrs_post_init__(self):
+        self._executor = ThreadPoolExecutor(self.limit)
+
+    async def compile(self, source, filename='<unknown>', timeout=None, separate_stmts=False, opt_level=0,
+                      passes=None, cache=None):
+        """Compile the source like :func:`porcupy.compiler.compile`.
+
+        Raise asyncio.TimeoutError if compilation takes longer than
+        *timeout* seconds, including time spent waiting for a worker.
+        """
+        cancelled = threading.Event()
+
+        def run():
+            return compile(source, filename, separate_stmts, opt_level, passes, cache, cancelled=cancelled)
+
+        try:
+            return await asyncio.wait_for(self.submit(run), timeout)
+        finally:
+            cancelled.set()
+
+    def stream(self, source, filename='<unknown>', timeout=None, opt_level=0, passes=None):
+        """Return an async iterator over pieces of the compiled scenario
+        that lines can be broken between.
+
+        Pieces are formatted in the worker and handed over one by one,
+        so the first of them arrive before the whole scenario is
+        formatted. Joined with spaces, they make the scenario. Call
+        ``aclose()`` to stop the worker when the rest of the pieces are
+        not needed.
+        """
+        return StatementStream(self, source, filename, timeout, opt_level, passes)
+
+    async def submit(self, func):
+        loop = asyncio.get_event_loop()
+        semaphore = self._semaphore(loop)
+        await semaphore.acquire()
+        try:
+            future = loop.run_in_executor(self._executor, func)
+        except BaseException:
+            semaphore.release()
+            raise
+
+        def release(future):
+            semaphore.release()
+            if not future.cancelled():
+                # Nobody might be waiting for the result anymore
+                future.exception()
+
+        # Worker is busy until the function returns, even if the caller
+        # stopped waiting for it
+        future.add_done_callback(release)
+        return await asyncio.shield(future)
+
+    def _semaphore(self, loop):
+        # Semaphores are bound to event loops
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.limit)
+        return semaphore
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait)
+
+
+@attr.s
+class StatementStream:
+    compiler = attr.ib()
+    source = attr.ib()
+    filename = attr.ib(default='<unknown>')
+    timeout = attr.ib(default=None)
+    opt_level = attr.ib(default=0)
+    passes = attr.ib(default=None)
+
+    cancelled = attr.ib(default=attr.Factory(threading.Event), init=False)
+    deadline = attr.ib(default=None, init=False)
+    queue = attr.ib(default=None, init=False)
+    task = attr.ib(default=None, init=False)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if self.cancelled.is_set():
+            raise StopAsyncIteration
+        if self.queue is None:
+            self.start()
+        try:
+            item = await asyncio.wait_for(self.queue.get(), self.remaining())
+        except BaseException:
+            self.close()
+            raise
+        if item is _END:
+            # Raise the error the worker stopped with, if any
+            await self.task
+            raise StopAsyncIteration
+        return item
+
+    def start(self):
+        loop = asyncio.get_event_loop()
+        if self.timeout is not None:
+            self.deadline = loop.time() + self.timeout
+        self.queue = asyncio.Queue()
+
+        def run():
+            try:
+                module = compile_module(self.source, self.filename, self.opt_level, self.passes,
+                                        cancelled=self.cancelled)
+                for piece in iter_pieces(module):
+                    if self.cancelled.is_set():
+                        break
+                    loop.call_soon_threadsafe(self.queue.put_nowait, piece)
+            finally:
+                loop.call_soon_threadsafe(self.queue.put_nowait, _END)
+
+        self.task = asyncio.ensure_future(self.compiler.submit(run), loop=loop)
+
+    def remaining(self):
+        if self.deadline is None:
+            return
+        return max(self.deadline - asyncio.get_event_loop().time(), 0)
+
+    async def aclose(self):
+        self.close()
+
+    def close(self):
+        self.cancelled.set()
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+
+_END = object()
+
+
+def default_compiler():
+    global _default_compiler
+    if _default_compiler is None:
+        _default_compiler = AsyncCompiler()
+    return _default_compiler
+
+
+async def compile_async(source, filename='<unknown>', timeout=None, separate_stmts=False, opt_level=0,
+                        passes=None, cache=None, compiler=None):
+    """Compile the source in a worker thread of a shared
+    :class:`AsyncCompiler`, unless another *compiler* is given.
+    """
+    if compiler is None:
+        compiler = default_compiler()
+    return await compiler.compile(source, filename, timeout, separate_stmts, opt_level, passes, cache)
+
+
+def compile_stream(source, filename='<unknown>', timeout=None, opt_level=0, passes=None, compiler=None):
+    if compiler is None:
+        compiler = default_compiler()
+    return compiler.stream(source, filename, timeout, opt_level, passes)
@@ -1,5 +1,5 @@
 import ast
-from collections import ChainMap
+from collections.abc import Mapping
 from numbers import Number
 from operator import add, sub, mul, truediv, floordiv, mod
 
@@ -9,10 +9,34 @@ __all__ = ('AST', 'Module', 'Assign', 'If', 'Const', 'Slot', 'BoolOp', 'BinOp',
 
 
 class AST:
-    pass
+    __slots__ = ()
 
 
-@attr.s
+class EmptyMetadata(Mapping):
+    """Read-only empty mapping shared by nodes without metadata."""
+
+    __slots__ = ()
+
+    def __getitem__(self, key):
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(())
+
+    def __len__(self):
+        return 0
+
+    def __repr__(self):
+        return '{}'
+
+    def __reduce__(self):
+        return 'EMPTY_METADATA'
+
+
+EMPTY_METADATA = EmptyMetadata()
+
+
+@attr.s(slots=True)
 class Module(AST):
     body = attr.ib()
 
@@ -20,30 +44,34 @@ class Module(AST):
         return '  '.join(map(str, self.body))
 
 
-@attr.s
+@attr.s(slots=True)
 class Assign(AST):
     target = attr.ib()
     value = attr.ib()
+    lineno = attr.ib(default=None, cmp=False, repr=False)
+    filename = attr.ib(default=None, cmp=False, repr=False)
 
     def __str__(self):
         return ' '.join([str(self.target), str(self.value)])
 
 
-@attr.s
+@attr.s(slots=True)
 class If(AST):
     test = attr.ib()
     body = attr.ib()
+    lineno = attr.ib(default=None, cmp=False, repr=False)
+    filename = attr.ib(default=None, cmp=False, repr=False)
 
     def __str__(self):
         body = '  '.join(map(str, self.body))
         return '# {} ( {} )'.format(self.test, body)
 
 
-@attr.s
+@attr.s(slots=True)
 class Const(AST):
     value = attr.ib()
     type = attr.ib(default=None)
-    metadata = attr.ib(default=attr.Factory(dict))
+    metadata = attr.ib(default=EMPTY_METADATA)
 
     def __attrs_post_init__(self):
         from .types import NumberType, StringType
@@ -75,15 +103,17 @@ class Const(AST):
             raise TypeError("cannot format '{}' const".format(self.type))
 
 
-@attr.s
+@attr.s(slots=True)
 class Slot(AST):
     register = attr.ib()
     index = attr.ib()
     attrib = attr.ib()
     type = attr.ib()
-    metadata = attr.ib(default=attr.Factory(dict))
+    metadata = attr.ib(default=EMPTY_METADATA)
     ref = attr.ib(default=False)
     short_form = attr.ib(default=False)
+    lineno = attr.ib(default=None, cmp=False, repr=False)
+    filename = attr.ib(default=None, cmp=False, repr=False)
 
     def is_variable(self):
         return self.register in ('p', 's')
@@ -104,44 +134,71 @@ class Slot(AST):
             return str(self.index)
 
 
-@attr.s(init=False)
+@attr.s(init=False, slots=True)
 class EvolvedSlot(AST):
+    """Slot with some of its fields changed.
+
+    Fields that are not changed are read from the original slot, because
+    temporary slots get their indices after they are used. Evolving an
+    evolved slot merges the changes, so the original is always one
+    lookup away.
+    """
+
     _original = attr.ib()
     _changes = attr.ib()
+    _text = attr.ib(cmp=False, repr=False)
 
     def __init__(self, inst, **changes):
         if isinstance(inst, EvolvedSlot):
-            super().__setattr__('_original', super(EvolvedSlot, inst).__getattribute__('_original'))
-            super().__setattr__('_changes', ChainMap(changes, super(EvolvedSlot, inst).__getattribute__('_changes')))
-        else:
-            super().__setattr__('_original', inst)
-            super().__setattr__('_changes', changes)
-
-    def __getattr__(self, name):
-        try:
-            return super().__getattribute__('_changes')[name]
-        except KeyError:
-            return super().__getattribute__('_original').__getattribute__(name)
-
-    def __setattr__(self, name, value):
-        if name in attr.asdict(super().__getattribute__('_original')):
-            super().__getattribute__('_changes')[name] = value
-        else:
-            super().__setattr__(name, value)
+            merged_changes = dict(inst._changes)
+            merged_changes.update(changes)
+            changes = merged_changes
+            inst = inst._original
+        self._original = inst
+        self._changes = changes
+        self._text = None
+
+    def is_variable(self):
+        return self._original.is_variable()
 
     def __str__(self):
-        return str(super().__getattribute__('apply_changes')())
+        # Index of the original may change until the module is finished
+        index = self._original.index
+        if self._text is None or self._text[0] != index:
+            self._text = (index, str(self.apply_changes()))
+        return self._text[1]
 
     def apply_changes(self):
-        return attr.evolve(super().__getattribute__('_original'), **super().__getattribute__('_changes'))
+        return attr.evolve(self._original, **self._changes)
+
+    def __reduce__(self):
+        return (EvolvedSlot._from_changes, (self._original, self._changes))
+
+    @staticmethod
+    def _from_changes(original, changes):
+        return EvolvedSlot(original, **changes)
+
+
+def _evolved_field(name):
+    def get(self):
+        changes = self._changes
+        if name in changes:
+            return changes[name]
+        return getattr(self._original, name)
+    return property(get)
+
 
+for _field in attr.fields(Slot):
+    setattr(EvolvedSlot, _field.name, _evolved_field(_field.name))
+del _field
 
-@attr.s
+
+@attr.s(slots=True)
 class Random(AST):
     value = attr.ib()
 
     type = attr.ib(init=False)
-    metadata = attr.ib(default=attr.Factory(dict))
+    metadata = attr.ib(default=EMPTY_METADATA)
 
     def __attrs_post_init__(self):
         from .types import IntType
@@ -151,13 +208,13 @@ class Random(AST):
         return '~{}'.format(self.value)
 
 
-@attr.s
+@attr.s(slots=True)
 class BoolOp(AST):
     op = attr.ib()
     values = attr.ib()
 
     type = attr.ib(init=False)
-    metadata = attr.ib(default=attr.Factory(dict))
+    metadata = attr.ib(default=EMPTY_METADATA)
 
     def __attrs_post_init__(self):
         from .types import BoolType
@@ -182,14 +239,14 @@ class BoolOp(AST):
             return '|'
 
 
-@attr.s
+@attr.s(slots=True)
 class BinOp(AST):
     left = attr.ib()
     op = attr.ib()
     right = attr.ib()
 
     type = attr.ib(init=False)
-    metadata = attr.ib(default=attr.Factory(dict))
+    metadata = attr.ib(default=EMPTY_METADATA)
 
     def __attrs_post_init__(self):
         from .types import NumberType, FloatType
@@ -209,10 +266,12 @@ class BinOp(AST):
 
 
 class operator:
-    pass
+    __slots__ = ()
 
 
 class Add(operator):
+    __slots__ = ()
+
     def __str__(self):
         return '+'
 
@@ -220,6 +279,8 @@ class Add(operator):
 
 
 class Sub(operator):
+    __slots__ = ()
+
     def __str__(self):
         return '-'
 
@@ -227,6 +288,8 @@ class Sub(operator):
 
 
 class Mult(operator):
+    __slots__ = ()
+
     def __str__(self):
         return '*'
 
@@ -234,6 +297,8 @@ class Mult(operator):
 
 
 class Div(operator):
+    __slots__ = ()
+
     def __str__(self):
         return '/'
 
@@ -241,6 +306,8 @@ class Div(operator):
 
 
 class FloorDiv(operator):
+    __slots__ = ()
+
     def __str__(self):
         return '{'
 
@@ -248,20 +315,22 @@ class FloorDiv(operator):
 
 
 class Mod(operator):
+    __slots__ = ()
+
     def __str__(self):
         return '}'
 
     __call__ = mod
 
 
-@attr.s
+@attr.s(slots=True)
 class Compare(AST):
     left = attr.ib()
     op = attr.ib()
     right = attr.ib()
 
     type = attr.ib(init=False)
-    metadata = attr.ib(default=attr.Factory(dict))
+    metadata = attr.ib(default=EMPTY_METADATA)
 
     def __attrs_post_init__(self):
         from .types import BoolType
@@ -289,10 +358,12 @@ class Compare(AST):
             return '>='
 
 
-@attr.s
+@attr.s(slots=True)
 class Call(AST):
     func = attr.ib()
     args = attr.ib()
+    lineno = attr.ib(default=None, cmp=False, repr=False)
+    filename = attr.ib(default=None, cmp=False, repr=False)
 
     def __str__(self):
         result = [str(self.func)]
@@ -302,9 +373,13 @@ class Call(AST):
         return ' '.join(result)
 
 
-@attr.s
+@attr.s(slots=True)
 class Label(AST):
     index = attr.ib()
+    lineno = attr.ib(default=None, cmp=False, repr=False)
+    filename = attr.ib(default=None, cmp=False, repr=False)
+    # Maximum number of iterations of the loop that starts at the label
+    bound = attr.ib(default=None, cmp=False, repr=False)
 
     def __str__(self):
         return ':{}'.format(self.index)
@@ -0,0 +1,158 @@
+from functools import lru_cache
+import hashlib
+import json
+import os
+import pickle
+import tempfile
+
+import attr
+
+from .ast import Label
+from .optimizer import iter_stmts, slot_indices
+
+DEFAULT_MAX_SIZE = 64 * 1024 * 1024
+
+
+@attr.s
+class CompilationCache:
+    """On-disk cache of compiled scenarios.
+
+    Entries are addressed by a hash of the source, the compiler itself
+    and compilation options. When total size of entries exceeds
+    *max_size* bytes, least recently used entries are removed.
+    """
+
+    path = attr.ib()
+    max_size = attr.ib(default=DEFAULT_MAX_SIZE)
+
+    hits = attr.ib(default=0, init=False)
+    misses = attr.ib(default=0, init=False)
+
+    def key(self, source, **options):
+        payload = json.dumps({
+            'compiler': compiler_digest(),
+            'source': source,
+            'options': options,
+        }, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        return self._load(key, ENTRY_SUFFIX)
+
+    def put(self, key, entry):
+        return self._store(key, ENTRY_SUFFIX, entry)
+
+    def get_object(self, key):
+        """Return object file of a module compiled for linking."""
+        return self._load(key, OBJECT_SUFFIX)
+
+    def put_object(self, key, obj):
+        return self._store(key, OBJECT_SUFFIX, obj)
+
+    def _load(self, key, suffix):
+        entry_path = self._entry_path(key, suffix)
+        serializer = SERIALIZERS[suffix]
+        try:
+            with open(entry_path, serializer.mode) as fp:
+                entry = serializer.load(fp)
+        except (OSError, EOFError, ValueError, pickle.UnpicklingError):
+            self.misses += 1
+            return
+        # Modification time tells which entries were used least recently
+        try:
+            os.utime(entry_path)
+        except OSError:
+            pass
+        self.hits += 1
+        return entry
+
+    def _store(self, key, suffix, entry):
+        os.makedirs(self.path, exist_ok=True)
+        serializer = SERIALIZERS[suffix]
+        # Write to a temporary file first, so that concurrent readers
+        # never see a partial entry
+        fd, temp_path = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with open(fd, serializer.mode.replace('r', 'w')) as fp:
+            serializer.dump(entry, fp)
+        os.replace(temp_path, self._entry_path(key, suffix))
+        self.evict()
+        return entry
+
+    def evict(self):
+        entries = []
+        total_size = 0
+        for name in os.listdir(self.path):
+            if not name.endswith(tuple(SERIALIZERS)):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.path, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+            total_size += stat.st_size
+
+        entries.sort()
+        for _, size, name in entries:
+            if total_size <= self.max_size:
+                break
+            try:
+                os.remove(os.path.join(self.path, name))
+            except OSError:
+                pass
+            total_size -= size
+
+    def clear(self):
+        if not os.path.isdir(self.path):
+            return
+        for name in os.listdir(self.path):
+            if name.endswith(tuple(SERIALIZERS)):
+                os.remove(os.path.join(self.path, name))
+
+    def _entry_path(self, key, suffix):
+        return os.path.join(self.path, key + suffix)
+
+
+@attr.s
+class Serializer:
+    load = attr.ib()
+    dump = attr.ib()
+    mode = attr.ib()
+
+
+ENTRY_SUFFIX = '.json'
+OBJECT_SUFFIX = '.pobj'
+SERIALIZERS = {
+    ENTRY_SUFFIX: Serializer(json.load, json.dump, 'r'),
+    OBJECT_SUFFIX: Serializer(pickle.load, pickle.dump, 'rb'),
+}
+
+
+def describe(module, scenario=None):
+    """Return cache entry for compiled module."""
+    if scenario is None:
+        scenario = str(module)
+    slots = set()
+    labels = 0
+    for stmt in iter_stmts(module.body):
+        slots |= slot_indices(stmt)
+        if isinstance(stmt, Label):
+            labels += 1
+    return {
+        'scenario': scenario,
+        'slots': sorted(slots - {None}),
+        'labels': labels,
+        # Statements are separated by a single space or newline in maps
+        'size': len(' '.join(scenario.split('  '))),
+    }
+
+
+@lru_cache(maxsize=None)
+def compiler_digest():
+    """Hash sources of the compiler, so that changing it invalidates cache."""
+    digest = hashlib.sha256()
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith('.py'):
+            with open(os.path.join(package_dir, name), 'rb') as fp:
+                digest.update(name.encode('utf-8') + b'\0' + fp.read())
+    return digest.hexdigest()
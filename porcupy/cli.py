@@ -1,12 +1,36 @@
 import argparse
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+import contextlib
+from functools import partial
+import glob
+import json
+import logging
+import os
+import shutil
 import struct
 import sys
+import tempfile
+import textwrap
+import time
 import traceback
+import tracemalloc
 import warnings
 
 import attr
 
-from . import compiler
+from . import linker, optimizer
+from .cache import CompilationCache, DEFAULT_MAX_SIZE, describe
+from .cost import check_tick_budget, estimate_cost, format_cost_report, format_location
+from .emitter import codewrap, iter_pieces, measure, pack_lines, source_map, write_lines  # noqa
+from .listing import format_listing
+from .metrics import Metrics, measure_phase
+from .profiler import Profiler
+from .target import DEFAULT_TARGET, check_field, find_target
+
+# Map files store the number of lines in a byte
+MAX_SAVED_LINES = 255
+SOURCE_MAP_SUFFIX = '.srcmap.json'
 
 
 def main():
@@ -15,9 +39,104 @@ def main():
     group = parser.add_mutually_exclusive_group()
     group.add_argument('-o', '--output', help='write compiled scenario to given file')
     group.add_argument('-a', '--attach', help='attach compiled scenario to given Yozhiks map')
+    parser.add_argument('--source-map', action='store_true',
+                        help='map compiled scenario to source lines in a file next to --output or --attach file, '
+                             'named with {} suffix'.format(SOURCE_MAP_SUFFIX))
     parser.add_argument('--encoding', default='cp1251', help='encode scenarios with given code page')
+    parser.add_argument('--target', default=DEFAULT_TARGET.name,
+                        help='limit slots, labels and scenario size to given game build, or to build '
+                             'described in given JSON file')
+    parser.add_argument('-O', dest='opt_level', default='0', choices=sorted(optimizer.PIPELINES),
+                        help='optimization level; -Os minimizes scenario size and fails if it does not fit in a map')
+    parser.add_argument('--passes', type=lambda value: value.split(','),
+                        help='run given comma-separated optimization passes instead of -O pipeline')
+    parser.add_argument('--time-passes', action='store_true', help='log time taken by each optimization pass')
+    parser.add_argument('--listing', action='store_true',
+                        help='print source lines next to statements they compile to, with their size, slots and '
+                             'scenario lines; the scenario itself is not printed without --output or --attach')
+    parser.add_argument('--cost-report', action='store_true',
+                        help='print statements executed per tick by each loop and source line')
+    parser.add_argument('--tick-budget', metavar='N', type=int,
+                        help='fail if scenario may execute more than given number of statements per tick')
+    parser.add_argument('--metrics', choices=['json'],
+                        help='print time taken by each phase, sizes and peak memory of the compilation')
+    parser.add_argument('--profile', action='store_true',
+                        help='print calls and time spent in each visitor and type method of the compiler')
+    parser.add_argument('--profile-output', metavar='FILE',
+                        help='write calls and time spent in each visitor and type method to given file, '
+                             'which can be read with pstats module')
+    parser.add_argument('--batch', metavar='PATH',
+                        help='attach scenarios to maps in given directory or listed in given manifest')
+    parser.add_argument('-j', '--jobs', type=int, help='number of processes for --batch, defaults to number of CPUs')
+    parser.add_argument('--cache', metavar='DIR', help='reuse scenarios compiled earlier and stored in given directory')
+    parser.add_argument('--cache-size', metavar='MB', type=int, default=DEFAULT_MAX_SIZE // 2**20,
+                        help='remove least recently used scenarios when cache grows over given size')
+    parser.add_argument('--cache-stats', action='store_true', help='print number of cache hits and misses')
+    parser.add_argument('--watch', action='store_true',
+                        help='keep running and attach scenarios again whenever their sources change')
+    parser.add_argument('--serve', action='store_true',
+                        help='keep running and answer JSON-RPC compile requests on standard input and output')
     args = parser.parse_args()
 
+    try:
+        target = find_target(args.target)
+    except (OSError, ValueError) as exc:
+        parser.error('argument --target: {}'.format(exc))
+    if args.tick_budget is not None:
+        try:
+            check_field('tick_budget', args.tick_budget)
+        except ValueError as exc:
+            parser.error('argument --tick-budget: {}'.format(exc))
+        target = attr.evolve(target, tick_budget=args.tick_budget)
+
+    cache = None
+    if args.cache is not None:
+        cache = CompilationCache(args.cache, args.cache_size * 2**20)
+
+    if args.time_passes:
+        logging.basicConfig(format='%(message)s')
+        optimizer.logger.setLevel(logging.DEBUG)
+
+    if args.metrics is not None and (args.serve or args.watch or args.batch is not None):
+        parser.error('argument --metrics: not allowed with --serve, --watch or --batch')
+    profile = args.profile or args.profile_output is not None
+    if profile and (args.serve or args.watch or args.batch is not None):
+        parser.error('argument --profile: not allowed with --serve, --watch or --batch')
+
+    if args.serve:
+        from .server import Server
+        Server(sys.stdin.buffer, sys.stdout.buffer, cache, target).serve()
+        sys.exit(0)
+
+    if args.watch:
+        if args.batch is not None:
+            find_jobs = partial(find_batch_jobs, args.batch)
+        elif args.input is not None and args.attach is not None:
+            def find_jobs():
+                return [BatchJob(args.input, args.attach)]
+        else:
+            parser.error('argument --watch: requires --batch, or --input and --attach')
+        try:
+            watch(find_jobs, args.encoding, args.opt_level, args.passes, cache=cache, target=target)
+        except KeyboardInterrupt:
+            pass
+        print_cache_stats(cache, args.cache_stats)
+        sys.exit(0)
+
+    if args.batch is not None:
+        if args.input is not None or args.output is not None or args.attach is not None:
+            parser.error('argument --batch: not allowed with --input, --output or --attach')
+        if args.jobs is not None and args.jobs < 1:
+            parser.error('argument -j/--jobs: must be at least 1')
+        try:
+            find_batch_jobs(args.batch)
+        except (OSError, ValueError) as exc:
+            parser.error('argument --batch: {}'.format(exc))
+        status = batch(args.batch, args.jobs, args.encoding, args.opt_level, args.passes, cache=cache,
+                       target=target)
+        print_cache_stats(cache, args.cache_stats)
+        sys.exit(status)
+
     reader = sys.stdin
     filename = '<stdin>'
     if args.input is not None:
@@ -26,79 +145,434 @@ def main():
 
     writer = sys.stdout
     line_width = 80
+    output = None
     if args.output is not None:
         writer = open(args.output, 'w')
+        output = args.output
     elif args.attach is not None:
-        writer = ScenarioAttacher(args.attach, args.encoding)
-        line_width = 255
-
-    status = cli(filename, reader, writer, line_width)
+        writer = ScenarioAttacher(args.attach, args.encoding, target)
+        line_width = target.line_width
+        output = args.attach
+    if args.source_map and output is None:
+        parser.error('argument --source-map: requires --output or --attach')
+    if args.listing and output is None:
+        writer = open(os.devnull, 'w')
+
+    def report(module, source):
+        if args.listing:
+            print(format_listing(module, line_width, {filename: source}))
+        if args.cost_report:
+            print(format_cost_report(estimate_cost(module, target)), file=sys.stderr)
+        if args.source_map:
+            write_source_map(module, line_width, output)
+
+    inspect = report if args.listing or args.cost_report or args.source_map else None
+    metrics = None
+    if args.metrics is not None:
+        metrics = Metrics()
+        tracemalloc.start()
+    profiler = Profiler()
+    try:
+        with profiler.instrument() if profile else contextlib.ExitStack():
+            status = cli(filename, reader, writer, line_width, args.opt_level, args.passes, cache, target, inspect,
+                         metrics)
+    except BaseException:
+        reader.close()
+        close_writer(writer, failed=True)
+        raise
+    if args.profile:
+        print(profiler.format_report(), file=sys.stderr)
+    if args.profile_output is not None:
+        profiler.dump(args.profile_output)
 
     reader.close()
-    writer.close()
+    close_writer(writer, failed=status is not None)
+    print_cache_stats(cache, args.cache_stats)
+    if metrics is not None and status is None:
+        _, metrics.memory_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print(json.dumps(attr.asdict(metrics)), file=sys.stderr)
 
     sys.exit(status)
 
 
-def cli(filename, reader, writer, width=80):
+def close_writer(writer, failed=False):
+    """Close the writer, or leave the map as it was if compilation
+    failed.
+    """
+    if failed and isinstance(writer, ScenarioAttacher):
+        writer.discard()
+    else:
+        writer.close()
+
+
+def print_cache_stats(cache, enabled):
+    if cache is None or not enabled:
+        return
+    print('cache: {} hits, {} misses'.format(cache.hits, cache.misses), file=sys.stderr)
+
+
+def cli(filename, reader, writer, width=80, opt_level='0', passes=None, cache=None, target=DEFAULT_TARGET,
+        inspect=None, metrics=None):
     source = reader.read()
     try:
-        compiled = compiler.compile(source, filename, separate_stmts=True)
+        lines = scenario_lines(source, filename, width, opt_level, passes, cache, target, inspect, metrics)
     except Exception as exc:
         lineno = getattr(exc, '_porcupy_lineno', None)
         if lineno is None:
             raise
-        print_exception(sys.exc_info(), filename, lineno)
+        print_exception(sys.exc_info(), getattr(exc, '_porcupy_filename', filename), lineno)
         return 1
-    wrapped = codewrap(compiled, width)
-    print(wrapped, file=writer)
+    with measure_phase(metrics, 'emit'):
+        chars, count = write_lines(lines, writer)
+    if metrics is not None:
+        # Line breaks are counted between lines only
+        metrics.chars, metrics.lines = chars - 1, count
+
+
+def scenario_lines(source, filename, width=80, opt_level='0', passes=None, cache=None, target=DEFAULT_TARGET,
+                   inspect=None, metrics=None):
+    """Compile the source and return lines of the scenario.
+
+    Without cache, lines are formatted one at a time as they are
+    consumed, so that they can be written out without building the
+    whole scenario. When *inspect* function is given, the scenario is
+    compiled even if it is cached, and the module and the source are
+    passed to it. Phases of the compilation are measured in *metrics*.
+    """
+    builder = linker.Builder(linker.search_path(filename), cache, target, metrics)
+    if cache is not None:
+        key = cache.key(source, opt_level=opt_level, passes=passes, width=width, target=attr.astuple(target),
+                        imports=builder.import_digests(source, filename))
+        entry = cache.get(key) if inspect is None else None
+        if entry is not None:
+            return entry['scenario'].split('\n')
+
+    module = builder.build(source, filename, opt_level, passes)
+    if opt_level == 's':
+        check_budget(module, target)
+    check_tick_budget(module, target)
+    if inspect is not None:
+        inspect(module, source)
+    if cache is None:
+        return pack_lines(iter_pieces(module), width)
+
+    with measure_phase(metrics, 'emit'):
+        scenario = '\n'.join(pack_lines(iter_pieces(module), width))
+    cache.put(key, describe(module, scenario))
+    return scenario.split('\n')
+
+
+def check_budget(module, target=DEFAULT_TARGET):
+    """Raise ValueError if compiled module does not fit in a map.
+
+    The error lists source lines that produce the most characters, and
+    points at the largest of them.
+    """
+    chars, lines = measure(module, target.line_width)
+    if chars <= target.max_chars and lines <= target.max_lines:
+        return
+
+    sizes = line_costs(module)
+    report = ['scenario does not fit in a map: {} characters (limit {}), {} lines (limit {})'
+              .format(chars, target.max_chars, lines, target.max_lines),
+              'characters by source line:']
+    for location, size in sizes.most_common(10):
+        report.append('  {}: {}'.format(format_location(*location), size))
+    exc = ValueError('\n'.join(report))
+    filename, exc._porcupy_lineno = sizes.most_common(1)[0][0]
+    if filename is not None:
+        exc._porcupy_filename = filename
+    raise exc
+
+
+def write_source_map(module, width, output):
+    with open(output + SOURCE_MAP_SUFFIX, 'w') as fp:
+        json.dump(source_map(module, width, os.path.basename(output)), fp)
+
+
+def line_costs(module):
+    """Count characters that each source line adds to the scenario.
+
+    Lines are keyed by file name and line number, because linked
+    modules come from different files.
+    """
+    sizes = Counter()
+    for stmt in module.body:
+        sizes[stmt.filename, stmt.lineno] += len(str(stmt)) + 1
+    return sizes
 
 
 def print_exception(exc_info, filename, lineno):
+    print(format_exception(exc_info, filename, lineno), end='', file=sys.stderr)
+
+
+def format_exception(exc_info, filename, lineno):
     te = traceback.TracebackException(*exc_info)
     fs = traceback.FrameSummary(filename, lineno, '<module>')
     te.stack = traceback.StackSummary.from_list([fs])
+    return ''.join(te.format())
 
-    for line in te.format():
-        print(line, end='', file=sys.stderr)
 
+@attr.s
+class BatchJob:
+    source = attr.ib()
+    target = attr.ib()
 
-def codewrap(text, width):
-    stmts = text.split('  ')
-    if width is None:
-        return ' '.join(stmts)
 
-    lines = []
-    line = []
-    for stmt in stmts:
-        length = len(' '.join(line + [stmt]))
-        if length > width:
-            lines.append(' '.join(line))
-            line = [stmt]
+@attr.s
+class BatchResult:
+    job = attr.ib()
+    error = attr.ib(default=None)
+    warnings = attr.ib(default=attr.Factory(list))
+    cache_hits = attr.ib(default=0)
+    cache_misses = attr.ib(default=0)
+
+
+def batch(path, jobs=None, encoding='cp1251', opt_level='0', passes=None, file=None, cache=None,
+          target=DEFAULT_TARGET):
+    """Compile scenarios and attach them to maps, one process per CPU.
+
+    *path* is either a directory, where every ``name.py`` that has a
+    ``name.egm`` next to it is attached to that map, or a manifest with
+    a source and a map path per line. Failures are reported and do not
+    stop other scenarios. Return 1 if any of them failed.
+
+    Worker processes share the on-disk *cache*, and their hits and
+    misses are added to it.
+    """
+    if file is None:
+        file = sys.stdout
+    batch_jobs = find_batch_jobs(path)
+    run = partial(run_batch_job, encoding=encoding, opt_level=opt_level, passes=passes, cache=cache,
+                  target=target)
+    if jobs == 1:
+        failed = report_batch(map(run, batch_jobs), file, cache)
+    else:
+        with ProcessPoolExecutor(jobs) as executor:
+            failed = report_batch(executor.map(run, batch_jobs), file, cache)
+    print('{} compiled, {} failed'.format(len(batch_jobs) - failed, failed), file=file)
+    return 1 if failed else 0
+
+
+def report_batch(results, file, cache=None):
+    failed = 0
+    for result in results:
+        if cache is not None:
+            cache.hits += result.cache_hits
+            cache.misses += result.cache_misses
+        if result.error is None:
+            print('ok      {} -> {}'.format(result.job.source, result.job.target), file=file)
         else:
-            line.append(stmt)
-    lines.append(' '.join(line))
-    return '\n'.join(lines)
+            failed += 1
+            print('FAILED  {}'.format(result.job.source), file=file)
+            print(textwrap.indent(result.error.rstrip('\n'), '    '), file=file)
+        for message in result.warnings:
+            print('    warning: {}'.format(message), file=file)
+    return failed
+
+
+def watch(find_jobs, encoding='cp1251', opt_level='0', passes=None, cache=None, interval=0.05, file=None,
+          target=DEFAULT_TARGET):
+    """Attach scenarios again whenever their sources change.
+
+    *find_jobs* is called on every poll, so that scenarios added to a
+    directory or manifest are picked up. Compilation happens in this
+    process, which keeps builtins and imports warm between edits.
+    """
+    if file is None:
+        file = sys.stdout
+    run = partial(run_batch_job, encoding=encoding, opt_level=opt_level, passes=passes, cache=cache,
+                  target=target)
+    stamps = {}
+    dependencies = {}
+    last_error = None
+    while True:
+        try:
+            jobs = find_jobs()
+        except (OSError, ValueError) as exc:
+            if str(exc) != last_error:
+                print('error: {}'.format(exc), file=file)
+                last_error = str(exc)
+        else:
+            last_error = None
+            changed = poll_changes(jobs, stamps, dependencies)
+            if changed:
+                report_batch(map(run, changed), file, cache)
+                file.flush()
+                for job in changed:
+                    # Imports might have changed too
+                    dependencies[job.source] = find_dependencies(job.source)
+                    poll_changes([job], stamps, dependencies)
+        time.sleep(interval)
+
+
+def poll_changes(jobs, stamps, dependencies=None):
+    """Return jobs whose sources or imported modules changed since the
+    last call.
+
+    *stamps* maps source paths to their modification time and size,
+    and is updated in place. *dependencies* maps sources to paths of
+    modules they import.
+    """
+    changed = []
+    for job in jobs:
+        paths = [job.source]
+        if dependencies is not None:
+            paths.extend(dependencies.get(job.source, []))
+        updated = False
+        for path in paths:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            # Modules are shared between jobs, so keep stamps per job
+            if stamps.get((job.source, path)) != stamp:
+                stamps[job.source, path] = stamp
+                updated = True
+        if updated:
+            changed.append(job)
+    return changed
+
+
+def find_dependencies(filename):
+    try:
+        with open(filename) as fp:
+            source = fp.read()
+    except OSError:
+        return []
+    return linker.Builder(linker.search_path(filename)).dependencies(source, filename)
+
+
+def find_batch_jobs(path):
+    if os.path.isdir(path):
+        batch_jobs = []
+        for source in sorted(glob.glob(os.path.join(path, '*.py'))):
+            target = os.path.splitext(source)[0] + '.egm'
+            if os.path.exists(target):
+                batch_jobs.append(BatchJob(source, target))
+        return batch_jobs
+
+    # Paths in manifest are relative to the manifest itself
+    basedir = os.path.dirname(path)
+    batch_jobs = []
+    with open(path) as fp:
+        for lineno, line in enumerate(fp, 1):
+            line = line.split('#', 1)[0].strip()
+            if not line:
+                continue
+            try:
+                source, target = line.split()
+            except ValueError:
+                raise ValueError('{}:{}: expected source and map paths, got {!r}'.format(path, lineno, line))
+            batch_jobs.append(BatchJob(os.path.join(basedir, source), os.path.join(basedir, target)))
+    return batch_jobs
+
+
+def run_batch_job(job, encoding='cp1251', opt_level='0', passes=None, cache=None, target=DEFAULT_TARGET):
+    result = BatchResult(job)
+    if cache is not None:
+        # Worker gets a copy of the cache, so count its own hits and misses
+        cache = attr.evolve(cache)
+    try:
+        attach_batch_job(job, result, encoding, opt_level, passes, cache, target)
+    except Exception:
+        result.error = traceback.format_exc()
+    finally:
+        if cache is not None:
+            result.cache_hits = cache.hits
+            result.cache_misses = cache.misses
+    return result
+
+
+def attach_batch_job(job, result, encoding, opt_level, passes, cache, target=DEFAULT_TARGET):
+    with open(job.source) as reader:
+        source = reader.read()
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always')
+        try:
+            lines = scenario_lines(source, job.source, target.line_width, opt_level, passes, cache, target)
+        except Exception as exc:
+            lineno = getattr(exc, '_porcupy_lineno', None)
+            if lineno is None:
+                raise
+            result.error = format_exception(sys.exc_info(), getattr(exc, '_porcupy_filename', job.source), lineno)
+            return
+        writer = ScenarioAttacher(job.target, encoding, target)
+        try:
+            write_lines(lines, writer)
+        except BaseException:
+            writer.discard()
+            raise
+        writer.close()
+    result.warnings = [str(warning.message) for warning in caught]
 
 
 @attr.s
 class ScenarioAttacher:
+    """Replace scenario of a Yozhiks map with text written to it.
+
+    Lines are encoded and written to a temporary file next to the map
+    as soon as they are complete, and the file replaces the map on
+    close.
+    """
+
     path = attr.ib()
     encoding = attr.ib(default='cp1251')
+    target = attr.ib(default=DEFAULT_TARGET)
 
-    _map = attr.ib(init=False)
+    _header = attr.ib(init=False)
+    _rest = attr.ib(init=False)
+    _file = attr.ib(init=False)
+    _temp_path = attr.ib(init=False)
+    _line = attr.ib(default='', init=False)
+    _chars = attr.ib(default=0, init=False)
+    _lines = attr.ib(default=0, init=False)
 
     def __attrs_post_init__(self):
         with open(self.path, 'rb') as fp:
-            self._map = Map.from_file(fp, self.encoding)
-            self._map.scenario = ''
+            game_map = Map.from_file(fp, self.encoding)
+        self._header = game_map.header
+        self._rest = game_map.rest
+        fd, self._temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(self.path)), suffix='.tmp')
+        self._file = open(fd, 'wb')
+        self._file.write(self._header)
+        # Number of lines is known only on close
+        self._file.write(b'\0')
 
     def write(self, data):
-        self._map.scenario += data
+        self._chars += len(data)
+        lines = (self._line + data).split('\n')
+        self._line = lines.pop()
+        for line in lines:
+            self._write_line(line)
+
+    def _write_line(self, line):
+        self._lines += 1
+        if self._lines > MAX_SAVED_LINES:
+            return
+        encoded = line.encode(self.encoding)
+        self._file.write(struct.pack('B', len(encoded)))
+        self._file.write(encoded)
 
     def close(self):
-        with open(self.path, 'wb') as fp:
-            self._map.save(fp, self.encoding)
+        if self._line:
+            self._write_line(self._line)
+            self._line = ''
+        check_scenario_size(self._chars, self._lines, self.target)
+
+        self._file.write(self._rest)
+        self._file.seek(len(self._header))
+        self._file.write(struct.pack('B', min(self._lines, MAX_SAVED_LINES)))
+        self._file.close()
+        shutil.copymode(self.path, self._temp_path)
+        os.replace(self._temp_path, self.path)
+
+    def discard(self):
+        """Leave the map as it was."""
+        self._file.close()
+        os.remove(self._temp_path)
 
 
 @attr.s
@@ -119,16 +593,10 @@ class Map:
 
         return cls(header, scenario, rest)
 
-    def save(self, writer, encoding='cp1251'):
-        if len(self.scenario) > 10000:
-            warnings.warn('scenario is over 10000 characters, extra characters will be discarded by Yozhiks')
-
+    def save(self, writer, encoding='cp1251', target=DEFAULT_TARGET):
         lines = self.scenario.splitlines()
-        if len(lines) > 255:
-            warnings.warn("scenario is over 255 lines, extra lines won't be saved")
-            lines = lines[:255]
-        elif len(lines) > 100:
-            warnings.warn('scenario is over 100 lines, extra lines will be discarded by Yozhiks')
+        check_scenario_size(len(self.scenario), len(lines), target)
+        lines = lines[:MAX_SAVED_LINES]
 
         writer.write(self.header)
         writer.write(struct.pack('B', len(lines)))
@@ -138,5 +606,16 @@ class Map:
         writer.write(self.rest)
 
 
+def check_scenario_size(chars, lines, target=DEFAULT_TARGET):
+    if chars > target.max_chars:
+        warnings.warn('scenario is over {} characters, extra characters will be discarded by Yozhiks'
+                      .format(target.max_chars))
+    if lines > MAX_SAVED_LINES:
+        warnings.warn("scenario is over {} lines, extra lines won't be saved".format(MAX_SAVED_LINES))
+    elif lines > target.max_lines:
+        warnings.warn('scenario is over {} lines, extra lines will be discarded by Yozhiks'
+                      .format(target.max_lines))
+
+
 if __name__ == '__main__':
     main()
@@ -1,6 +1,11 @@
 import ast
-from collections import defaultdict
+import re
+from collections import ChainMap, defaultdict
+from concurrent.futures import CancelledError
 from fractions import Fraction
+from functools import lru_cache
+from types import MappingProxyType
+import tracemalloc
 
 import attr
 
@@ -10,21 +15,107 @@ from .ast import (AST, Module, Assign, If, Const, Slot, EvolvedSlot, BoolOp,
 from .gameobjs import (Yozhik, Timer, Point, Bot, System, Button, Door,
                        Viewport, Sheep)
 from .types import (NumberType, IntType, BoolType, FloatType, StringType,
-                    ListPointer, Slice, CallableType, check_type)
-
+                    ListPointer, Slice, CallableType, ModuleType, check_type)
+from . import optimizer
+from .cache import describe
+from .emitter import iter_pieces
+from .metrics import measure_phase
+from .target import DEFAULT_TARGET
+
+LOOP_BOUND_COMMENT = re.compile(r'#\s*bound:\s*(\d+)')
+
+
+def compile(source, filename='<unknown>', separate_stmts=False, opt_level=0, passes=None, cache=None,
+            session=None, cancelled=None, target=DEFAULT_TARGET, metrics=None):
+    """Compile the source to a scenario.
+
+    When *metrics* is given, it is filled with measurements of the
+    compilation.
+    """
+    if cache is None:
+        converted_tree = compile_module(source, filename, opt_level, passes, session, cancelled, target, metrics)
+        if converted_tree is None:
+            return
+        with measure_phase(metrics, 'emit'):
+            if separate_stmts:
+                compiled = str(converted_tree)
+            else:
+                compiled = ' '.join(iter_pieces(converted_tree))
+    else:
+        options = {}
+        if target != DEFAULT_TARGET:
+            options['target'] = attr.astuple(target)
+        key = cache.key(source, opt_level=str(opt_level), passes=passes, **options)
+        entry = cache.get(key)
+        if entry is None:
+            converted_tree = compile_module(source, filename, opt_level, passes, session, cancelled, target, metrics)
+            if converted_tree is None:
+                return
+            with measure_phase(metrics, 'emit'):
+                entry = cache.put(key, describe(converted_tree))
+        compiled = entry['scenario']
+        if not separate_stmts:
+            compiled = ' '.join(compiled.split('  '))
+
+    if metrics is not None:
+        metrics.count_output(compiled)
+        if tracemalloc.is_tracing():
+            _, metrics.memory_peak = tracemalloc.get_traced_memory()
+    return compiled
 
-def compile(source, filename='<unknown>', separate_stmts=False):
-    ast_tree = ast.parse(source, filename)
 
-    converter = NodeConverter()
-    converted_tree = visit_with_exc_wrapping(converter, ast_tree, filename)
+def compile_module(source, filename='<unknown>', opt_level=0, passes=None, session=None, cancelled=None,
+                   target=DEFAULT_TARGET, metrics=None):
+    """Compile the source to a module.
+
+    When *session* is given, top-level statements that did not change
+    since the previous compilation in the session are not converted
+    again. When *cancelled* event is set, CancelledError is raised
+    before converting the next statement. Slots and labels are limited
+    by *target*. Phases of the compilation are measured in *metrics*.
+    """
+    if passes is None:
+        pass_manager = optimizer.PassManager.from_level(opt_level)
+    else:
+        pass_manager = optimizer.PassManager(passes)
+
+    with measure_phase(metrics, 'parse'):
+        ast_tree = ast.parse(source, filename)
+        annotate_loop_bounds(ast_tree, source)
+
+    with measure_phase(metrics, 'convert'):
+        if session is None:
+            converter = NodeConverter(cancelled=cancelled, target=target, filename=filename)
+            converted_tree = visit_with_exc_wrapping(converter, ast_tree, filename)
+            scope = converter.scope
+        else:
+            converted_tree, scope = session.convert(source, ast_tree, filename, cancelled, target)
     if converted_tree is None:
         return
-    converter.scope.allocate_temporary()
-    compiled = str(converted_tree)
-    if not separate_stmts:
-        compiled = ' '.join(compiled.split('  '))
-    return compiled
+    with measure_phase(metrics, 'allocate'):
+        scope.allocate_temporary()
+    if metrics is not None:
+        metrics.count_converted(converted_tree, scope)
+    with measure_phase(metrics, 'optimize'):
+        module = pass_manager.run(converted_tree, scope)
+    if metrics is not None:
+        metrics.emitted_stmts += len(module.body)
+    return module
+
+
+def annotate_loop_bounds(tree, source):
+    """Read maximum iteration counts from ``# bound: N`` comments.
+
+    The comment must be on the first line of a loop statement.
+    """
+    if 'bound:' not in source:
+        return
+    lines = source.splitlines()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.For, ast.While)):
+            match = LOOP_BOUND_COMMENT.search(lines[node.lineno-1])
+            if match is not None:
+                node.porcupy_bound = int(match.group(1))
 
 
 def visit_with_exc_wrapping(converter, node, filename):
@@ -45,26 +136,38 @@ def visit_with_exc_wrapping(converter, node, filename):
 
 @attr.s
 class NodeConverter:
-    scope = attr.ib(default=attr.Factory(lambda: Scope()))
+    scope = attr.ib(default=None)
     body = attr.ib(default=attr.Factory(list))
     last_label = attr.ib(default=0)
     loop_labels = attr.ib(default=attr.Factory(list))
     current_stmt = attr.ib(default=None)
     slots_to_recycle_later = attr.ib(default=attr.Factory(lambda: defaultdict(list)))
+    importer = attr.ib(default=None)
+    cancelled = attr.ib(default=None)
+    target = attr.ib(default=DEFAULT_TARGET)
+    filename = attr.ib(default=None)
+
+    def __attrs_post_init__(self):
+        if self.scope is None:
+            self.scope = Scope.for_target(self.target)
 
     def visit(self, node):
         if isinstance(node, AST):
             return node
         if isinstance(node, ast.stmt):
+            if self.cancelled is not None and self.cancelled.is_set():
+                raise CancelledError('compilation was cancelled')
             self.current_stmt = node
 
-        method = 'visit_' + node.__class__.__name__
-        visitor = getattr(self, method, self.generic_visit)
-        result = visitor(node)
+        visitor = self.visitors.get(node.__class__)
+        if visitor is None:
+            return self.generic_visit(node)
+        result = visitor(self, node)
 
-        for slot in self.slots_to_recycle_later[node]:
-            self.scope.recycle_temporary(slot)
-        del self.slots_to_recycle_later[node]
+        # Temporaries are recycled after the statement that used them
+        if self.slots_to_recycle_later:
+            for slot in self.slots_to_recycle_later.pop(node, ()):
+                self.scope.recycle_temporary(slot)
 
         return result
 
@@ -72,10 +175,49 @@ class NodeConverter:
         raise NotImplementedError("node '{}' is not implemented".format(node))
 
     def visit_Module(self, node):
+        for stmt in node.body:
+            self.check_imports(stmt)
         for stmt in node.body:
             self.visit(stmt)
         return Module(self.body)
 
+    def check_imports(self, stmt):
+        # Only compound statements contain other statements
+        if not hasattr(stmt, 'body'):
+            return
+        for child in ast.walk(stmt):
+            if child is not stmt and isinstance(child, (ast.Import, ast.ImportFrom)):
+                self.current_stmt = child
+                raise NotImplementedError('imports are only supported at module level')
+
+    def visit_Import(self, node):
+        for alias in node.names:
+            if alias.asname is None and '.' in alias.name:
+                raise NotImplementedError("importing submodule '{}' requires 'as' clause".format(alias.name))
+            obj = self.import_module(alias.name)
+            self.scope.names[alias.asname or alias.name] = Const(None, ModuleType(obj.name, obj.exports))
+
+    def visit_ImportFrom(self, node):
+        if node.level:
+            raise NotImplementedError('relative imports are not supported')
+        obj = self.import_module(node.module)
+        for alias in node.names:
+            if alias.name == '*':
+                raise NotImplementedError("'from {} import *' is not supported".format(node.module))
+            try:
+                value = obj.exports[alias.name]
+            except KeyError:
+                raise ImportError("cannot import name '{}' from '{}'".format(alias.name, node.module)) from None
+            self.scope.names[alias.asname or alias.name] = value
+
+    def import_module(self, name):
+        if self.importer is None:
+            raise ImportError("cannot import '{}': modules are only available to linked scenarios".format(name))
+        obj = self.importer(name)
+        # Items of imported lists are reached by index from this module
+        self.scope.external_slots.update(obj.list_items)
+        return obj
+
     def visit_Assign(self, node):
         # TODO: Reassign lists to list pointers without allocating more memory:
         # 'x = [11, 22]; x = [11, 22]' -> 'p1z 11 p2z 22 p4z 1 p1z 11 p2z 22'
@@ -183,12 +325,17 @@ class NodeConverter:
         test = Compare(index, ast.Lt(), iter_len)
 
         subscript = ast.Subscript(value=iter_slot, slice=index, ctx=ast.Load())
-        assign = ast.Assign(targets=[target], value=subscript)
+        assign = ast.copy_location(ast.Assign(targets=[target], value=subscript), node)
         body = [assign] + node.body
 
-        increment_index = ast.AugAssign(target=index, op=ast.Add(), value=Const(1))
+        increment_index = ast.copy_location(ast.AugAssign(target=index, op=ast.Add(), value=Const(1)), node)
 
-        self.visit_While(ast.While(test, body, node.orelse), before_test=increment_index)
+        loop = ast.copy_location(ast.While(test, body, node.orelse), node)
+        if isinstance(iter_len, Const):
+            loop.porcupy_bound = iter_len.value
+        else:
+            loop.porcupy_bound = getattr(node, 'porcupy_bound', None)
+        self.visit_While(loop, before_test=increment_index)
 
         if temp_index is not None:
             self.scope.recycle_temporary(temp_index)
@@ -196,6 +343,7 @@ class NodeConverter:
     def visit_While(self, node, before_test=None):
         # While(expr test, stmt* body, stmt* orelse)
         label_start = self.new_label()
+        label_start.bound = getattr(node, 'porcupy_bound', None)
         self.append_node(label_start)
         if before_test is not None:
             self.visit(before_test)
@@ -242,14 +390,19 @@ class NodeConverter:
 
         not_test = self.negate_bool(test)
 
+        # Jumps and labels that follow the body belong to the statement
+        # itself rather than to the last statement of the body
+        lineno = getattr(node, 'lineno', None)
         label_end = self.new_label()
-        goto_end = Slot('g', label_end.index, 'z', None)
+        label_end.lineno = lineno
+        goto_end = Slot('g', label_end.index, 'z', None, lineno=lineno)
         if is_loop:
             self.loop_labels.append((label_start, label_end))
 
         label_else = None
         if not self.is_body_empty(node.orelse):
             label_else = self.new_label()
+            label_else.lineno = lineno
             goto_else = Slot('g', label_else.index, 'z', None)
             self.append_node(If(not_test, [goto_else]))
         else:
@@ -259,7 +412,7 @@ class NodeConverter:
             self.visit(stmt)
 
         if is_loop:
-            goto_start = Slot('g', label_start.index, 'z', None)
+            goto_start = Slot('g', label_start.index, 'z', None, lineno=lineno)
             self.append_node(goto_start)
 
         if label_else is not None:
@@ -274,7 +427,7 @@ class NodeConverter:
 
     def new_label(self):
         self.last_label += 1
-        if self.last_label > 99:
+        if self.last_label > self.target.labels:
             raise ValueError('ran out of jump labels')
         return Label(self.last_label)
 
@@ -459,10 +612,25 @@ class NodeConverter:
         return bool_slot
 
     def visit_BinOp(self, node):
-        left = self.visit(node.left)
-        op = self.convert_bin_operator(node.op)
-        right = self.visit(node.right)
-        return left.type._bin_op(self, left, op, right)
+        # Chains like 'a + b + c + ...' nest as deep as they are long, so
+        # they are lowered with a stack of pending operations instead of
+        # recursion. Operands are still visited left to right.
+        operands = []
+        pending = [node]
+        while pending:
+            item = pending.pop()
+            if item is _APPLY_BIN_OP:
+                right = operands.pop()
+                op = operands.pop()
+                left = operands.pop()
+                operands.append(left.type._bin_op(self, left, op, right))
+            elif isinstance(item, ast.BinOp):
+                pending.extend([_APPLY_BIN_OP, item.right, item.op, item.left])
+            elif isinstance(item, (ast.operator, operator)):
+                operands.append(self.convert_bin_operator(item))
+            else:
+                operands.append(self.visit(item))
+        return operands.pop()
 
     def convert_bin_operator(self, value):
         if isinstance(value, operator):
@@ -546,6 +714,10 @@ class NodeConverter:
         self.append_node(Assign(dest, src))
 
     def append_node(self, stmt):
+        if stmt.lineno is None and self.current_stmt is not None:
+            stmt.lineno = getattr(self.current_stmt, 'lineno', None)
+        if stmt.filename is None:
+            stmt.filename = self.filename
         self.body.append(stmt)
 
     def recycle_later(self, *slots):
@@ -558,112 +730,38 @@ class NodeConverter:
         return target.id is not None and target.id.isupper()
 
 
+def visitor_table(converter_class):
+    """Map classes of Python nodes to visitor methods of the converter."""
+    table = {}
+    for name in dir(converter_class):
+        if not name.startswith('visit_'):
+            continue
+        node_class = getattr(ast, name[len('visit_'):], None)
+        if isinstance(node_class, type) and issubclass(node_class, ast.AST):
+            table[node_class] = getattr(converter_class, name)
+    return table
+
+
+NodeConverter.visitors = visitor_table(NodeConverter)
+
+_APPLY_BIN_OP = object()
+
+
 @attr.s
 class Scope:
-    names = attr.ib(default=attr.Factory(dict))
+    names = attr.ib(default=attr.Factory(lambda: ChainMap({}, builtin_names())))
     numeric_slots = attr.ib(default=attr.Factory(lambda: Slots(start=1)))
     string_slots = attr.ib(default=attr.Factory(lambda: Slots()))
     temporary_slots = attr.ib(default=attr.Factory(list))
     recycled_temporary_slots = attr.ib(default=attr.Factory(lambda: defaultdict(list)))
+    reused_temporaries = attr.ib(default=0)
+    list_item_slots = attr.ib(default=attr.Factory(set))
+    external_slots = attr.ib(default=attr.Factory(set))
 
-    def __attrs_post_init__(self):
-        self.populate_builtins()
-        self.populate_consts()
-        self.populate_game_objects()
-        self.populate_system_functions()
-
-    def populate_builtins(self):
-        from .functions import capacity, length, randint, slice
-        from .types import Range, Reversed
-
-        self.names['bool'] = Const(None, BoolType())
-        self.names['float'] = Const(None, FloatType())
-        self.names['int'] = Const(None, IntType())
-
-        self.names['range'] = Const(None, Range())
-        self.names['reversed'] = Const(None, Reversed())
-
-        self.names['cap'] = Const(None, CallableType.from_function(capacity))
-        self.names['len'] = Const(None, CallableType.from_function(length))
-        self.names['randint'] = Const(None, CallableType.from_function(randint))
-        self.names['slice'] = Const(None, CallableType.from_function(slice))
-
-    def populate_game_objects(self):
-        from .types import GameObjectList
-        self.names['bots'] = Const(None, GameObjectList(Bot(), 1, 10))
-        self.names['buttons'] = Const(None, GameObjectList(Button(), 1, 50))
-        self.names['doors'] = Const(None, GameObjectList(Door(), 1, 50))
-        self.names['points'] = Const(None, GameObjectList(Point(), 1, 100))
-        self.names['timers'] = Const(None, GameObjectList(Timer(), 1, 100))
-        self.names['yozhiks'] = Const(None, GameObjectList(Yozhik(), 1, 10))
-        self.names['system'] = Slot(System.metadata['abbrev'], None, None, System())
-        self.names['viewport'] = Slot(Viewport.metadata['abbrev'], None, None, Viewport())
-
-    def populate_consts(self):
-        from .gameobjs import Weapon, FragLimit, GameMode, DoorState, BotLevel
-        int_type = IntType()
-
-        self.names['W_BFG10K'] = Const(int(Weapon.bfg10k), int_type)
-        self.names['W_BLASTER'] = Const(int(Weapon.blaster), int_type)
-        self.names['W_SHOTGUN'] = Const(int(Weapon.shotgun), int_type)
-        self.names['W_SUPER_SHOTGUN'] = Const(int(Weapon.super_shotgun), int_type)
-        self.names['W_MACHINE_GUN'] = Const(int(Weapon.machine_gun), int_type)
-        self.names['W_CHAIN_GUN'] = Const(int(Weapon.chain_gun), int_type)
-        self.names['W_GRENADE_LAUNCHER'] = Const(int(Weapon.grenade_launcher), int_type)
-        self.names['W_ROCKET_LAUNCHER'] = Const(int(Weapon.rocket_launcher), int_type)
-        self.names['W_HYPERBLASTER'] = Const(int(Weapon.hyperblaster), int_type)
-        self.names['W_RAILGUN'] = Const(int(Weapon.railgun), int_type)
-
-        self.names['DS_CLOSED'] = Const(int(DoorState.closed), int_type)
-        self.names['DS_OPEN'] = Const(int(DoorState.open), int_type)
-        self.names['DS_OPENING'] = Const(int(DoorState.opening), int_type)
-        self.names['DS_CLOSING'] = Const(int(DoorState.closing), int_type)
-
-        self.names['FL_10'] = Const(int(FragLimit.ten), int_type)
-        self.names['FL_20'] = Const(int(FragLimit.twenty), int_type)
-        self.names['FL_30'] = Const(int(FragLimit.thirty), int_type)
-        self.names['FL_50'] = Const(int(FragLimit.fifty), int_type)
-        self.names['FL_100'] = Const(int(FragLimit.one_hundred), int_type)
-        self.names['FL_200'] = Const(int(FragLimit.two_hundred), int_type)
-
-        self.names['BL_VERY_EASY'] = Const(int(BotLevel.very_easy), int_type)
-        self.names['BL_EASY'] = Const(int(BotLevel.easy), int_type)
-        self.names['BL_NORMAL'] = Const(int(BotLevel.normal), int_type)
-        self.names['BL_HARD'] = Const(int(BotLevel.hard), int_type)
-        self.names['BL_IMPOSSIBLE'] = Const(int(BotLevel.impossible), int_type)
-
-        self.names['GM_MULTI_LAN'] = Const(int(GameMode.multi_lan), int_type)
-        self.names['GM_MULTI_DUEL'] = Const(int(GameMode.multi_duel), int_type)
-        self.names['GM_HOT_SEAT'] = Const(int(GameMode.hot_seat), int_type)
-        self.names['GM_MENU'] = Const(int(GameMode.menu), int_type)
-        self.names['GM_SINGLE'] = Const(int(GameMode.single), int_type)
-        self.names['GM_SHEEP'] = Const(int(GameMode.sheep), int_type)
-        self.names['GM_HOT_SEAT_SPLIT'] = Const(int(GameMode.hot_seat_split), int_type)
-
-    def populate_system_functions(self):
-        from .types import GameObjectMethod
-
-        system = System()
-        sheep = Sheep()
-        methods = [
-            (system, 'print', 'print'),
-            (system, 'print_at', 'print_at'),
-            (system, 'set_color', 'set_color'),
-            (system, 'load_map', 'load_map'),
-            (sheep, 'spawn', 'spawn_sheep'),
-        ]
-        for type, attrname, name in methods:
-            method = getattr(type, attrname)
-            try:
-                metadata = method.metadata
-                method_abbrev = metadata['abbrev']
-            except (AttributeError, KeyError):
-                self.names[name] = Const(None, CallableType.from_function(method))
-            else:
-                self.names[name] = Slot(type.metadata['abbrev'],
-                                        None,
-                                        method_abbrev,
-                                        GameObjectMethod(method))
+    @classmethod
+    def for_target(cls, target):
+        return cls(numeric_slots=Slots(start=1, stop=target.numeric_slots + 1),
+                   string_slots=Slots(stop=target.string_slots))
 
     def define_const(self, name, value):
         self.names[name] = value
@@ -689,7 +787,7 @@ class Scope:
         else:
             raise TypeError("cannot get slot of type '{}'".format(type))
 
-        if not slots.is_reserved(index):
+        if index not in self.external_slots and not slots.is_reserved(index):
             raise IndexError("slot #{} is not reserved".format(index))
         return Slot(register, index, 'z', type)
 
@@ -703,7 +801,14 @@ class Scope:
             raise TypeError("cannot allocate slot of type '{}'".format(type))
 
     def allocate_many(self, type, length):
-        return [self.allocate(type) for _ in range(length)]
+        if not isinstance(type, NumberType):
+            raise TypeError("cannot allocate slot of type '{}'".format(type))
+        # Items are addressed by pointer arithmetic, so they take slots in
+        # a row and their indices must stay put
+        first = self.numeric_slots.allocate_many(length)
+        indices = range(first, first + length)
+        self.list_item_slots.update(indices)
+        return [Slot('p', index, 'z', type) for index in indices]
 
     def get_temporary(self, type):
         if not isinstance(type, (NumberType, StringType)):
@@ -713,6 +818,7 @@ class Scope:
         if self.recycled_temporary_slots[base_type]:
             slot = self.recycled_temporary_slots[base_type].pop()
             slot.type = type
+            self.reused_temporaries += 1
             return slot
 
         slot = Slot('p', None, 'z', type)
@@ -740,25 +846,213 @@ class Scope:
             raise NameError("name '{}' is not defined".format(name))
         return slot
 
+    def copy(self):
+        """Return a scope that can be changed independently of this one.
+
+        Slots themselves are shared.
+        """
+        return Scope(
+            names=ChainMap(dict(self.names.maps[0]), *self.names.maps[1:]),
+            numeric_slots=self.numeric_slots.copy(),
+            string_slots=self.string_slots.copy(),
+            temporary_slots=list(self.temporary_slots),
+            recycled_temporary_slots=defaultdict(list, {type: list(slots) for type, slots
+                                                        in self.recycled_temporary_slots.items()}),
+            reused_temporaries=self.reused_temporaries,
+            list_item_slots=set(self.list_item_slots),
+            external_slots=set(self.external_slots),
+        )
+
+
+@lru_cache(maxsize=None)
+def builtin_names():
+    """Build the table of builtin names once per process.
+
+    The table is read-only and shared by all scopes, which put user
+    names on top of it with a ChainMap.
+    """
+    names = {}
+    populate_builtins(names)
+    populate_consts(names)
+    populate_game_objects(names)
+    populate_system_functions(names)
+    return MappingProxyType(names)
+
+
+def populate_builtins(names):
+    from .functions import capacity, length, randint, slice
+    from .types import Range, Reversed
+
+    names['bool'] = Const(None, BoolType())
+    names['float'] = Const(None, FloatType())
+    names['int'] = Const(None, IntType())
+
+    names['range'] = Const(None, Range())
+    names['reversed'] = Const(None, Reversed())
+
+    names['cap'] = Const(None, CallableType.from_function(capacity))
+    names['len'] = Const(None, CallableType.from_function(length))
+    names['randint'] = Const(None, CallableType.from_function(randint))
+    names['slice'] = Const(None, CallableType.from_function(slice))
+
+
+def populate_game_objects(names):
+    from .types import GameObjectList
+    names['bots'] = Const(None, GameObjectList(Bot(), 1, 10))
+    names['buttons'] = Const(None, GameObjectList(Button(), 1, 50))
+    names['doors'] = Const(None, GameObjectList(Door(), 1, 50))
+    names['points'] = Const(None, GameObjectList(Point(), 1, 100))
+    names['timers'] = Const(None, GameObjectList(Timer(), 1, 100))
+    names['yozhiks'] = Const(None, GameObjectList(Yozhik(), 1, 10))
+    names['system'] = Slot(System.metadata['abbrev'], None, None, System())
+    names['viewport'] = Slot(Viewport.metadata['abbrev'], None, None, Viewport())
+
+
+def populate_consts(names):
+    from .gameobjs import Weapon, FragLimit, GameMode, DoorState, BotLevel
+    int_type = IntType()
+
+    names['W_BFG10K'] = Const(int(Weapon.bfg10k), int_type)
+    names['W_BLASTER'] = Const(int(Weapon.blaster), int_type)
+    names['W_SHOTGUN'] = Const(int(Weapon.shotgun), int_type)
+    names['W_SUPER_SHOTGUN'] = Const(int(Weapon.super_shotgun), int_type)
+    names['W_MACHINE_GUN'] = Const(int(Weapon.machine_gun), int_type)
+    names['W_CHAIN_GUN'] = Const(int(Weapon.chain_gun), int_type)
+    names['W_GRENADE_LAUNCHER'] = Const(int(Weapon.grenade_launcher), int_type)
+    names['W_ROCKET_LAUNCHER'] = Const(int(Weapon.rocket_launcher), int_type)
+    names['W_HYPERBLASTER'] = Const(int(Weapon.hyperblaster), int_type)
+    names['W_RAILGUN'] = Const(int(Weapon.railgun), int_type)
+
+    names['DS_CLOSED'] = Const(int(DoorState.closed), int_type)
+    names['DS_OPEN'] = Const(int(DoorState.open), int_type)
+    names['DS_OPENING'] = Const(int(DoorState.opening), int_type)
+    names['DS_CLOSING'] = Const(int(DoorState.closing), int_type)
+
+    names['FL_10'] = Const(int(FragLimit.ten), int_type)
+    names['FL_20'] = Const(int(FragLimit.twenty), int_type)
+    names['FL_30'] = Const(int(FragLimit.thirty), int_type)
+    names['FL_50'] = Const(int(FragLimit.fifty), int_type)
+    names['FL_100'] = Const(int(FragLimit.one_hundred), int_type)
+    names['FL_200'] = Const(int(FragLimit.two_hundred), int_type)
+
+    names['BL_VERY_EASY'] = Const(int(BotLevel.very_easy), int_type)
+    names['BL_EASY'] = Const(int(BotLevel.easy), int_type)
+    names['BL_NORMAL'] = Const(int(BotLevel.normal), int_type)
+    names['BL_HARD'] = Const(int(BotLevel.hard), int_type)
+    names['BL_IMPOSSIBLE'] = Const(int(BotLevel.impossible), int_type)
+
+    names['GM_MULTI_LAN'] = Const(int(GameMode.multi_lan), int_type)
+    names['GM_MULTI_DUEL'] = Const(int(GameMode.multi_duel), int_type)
+    names['GM_HOT_SEAT'] = Const(int(GameMode.hot_seat), int_type)
+    names['GM_MENU'] = Const(int(GameMode.menu), int_type)
+    names['GM_SINGLE'] = Const(int(GameMode.single), int_type)
+    names['GM_SHEEP'] = Const(int(GameMode.sheep), int_type)
+    names['GM_HOT_SEAT_SPLIT'] = Const(int(GameMode.hot_seat_split), int_type)
+
+
+def populate_system_functions(names):
+    from .types import GameObjectMethod
+
+    system = System()
+    sheep = Sheep()
+    methods = [
+        (system, 'print', 'print'),
+        (system, 'print_at', 'print_at'),
+        (system, 'set_color', 'set_color'),
+        (system, 'load_map', 'load_map'),
+        (sheep, 'spawn', 'spawn_sheep'),
+    ]
+    for type, attrname, name in methods:
+        method = getattr(type, attrname)
+        try:
+            metadata = method.metadata
+            method_abbrev = metadata['abbrev']
+        except (AttributeError, KeyError):
+            names[name] = Const(None, CallableType.from_function(method))
+        else:
+            names[name] = Slot(type.metadata['abbrev'],
+                               None,
+                               method_abbrev,
+                               GameObjectMethod(method))
+
 
 @attr.s
 class Slots:
+    """Reserve slot indices from *start* up to, but not including, *stop*.
+
+    Reserved slots are bits of an integer, so the lowest free slot and
+    the lowest run of free slots are found with a few bit operations
+    instead of a scan.
+    """
+
     start = attr.ib(default=0)
     stop = attr.ib(default=100)
-    slots = attr.ib(init=False)
-
-    def __attrs_post_init__(self):
-        self.slots = [None for x in range(self.start, self.stop)]
+    reserved = attr.ib(default=0, init=False)
 
     def allocate(self):
-        for addr, value in enumerate(self.slots):
-            if value is None:
-                self.slots[addr] = RESERVED
-                return addr + self.start
-        raise MemoryError('ran out of variable slots')
+        return self.allocate_many(1)
+
+    def allocate_many(self, length):
+        """Reserve *length* slots in a row and return the first of them."""
+        if length < 1:
+            raise ValueError('cannot allocate {} slots'.format(length))
+        # Bit i of runs is set if slots from i to i+length-1 are free
+        runs = ~self.reserved & ((1 << (self.stop - self.start)) - 1)
+        covered = 1
+        while covered < length:
+            step = min(covered, length - covered)
+            runs &= runs >> step
+            covered += step
+        if not runs:
+            raise MemoryError('ran out of variable slots')
+        addr = (runs & -runs).bit_length() - 1
+        self.reserved |= ((1 << length) - 1) << addr
+        return addr + self.start
+
+    def free(self, index, length=1):
+        """Release *length* slots in a row starting from *index*."""
+        addr = index - self.start
+        mask = ((1 << length) - 1) << addr
+        if addr < 0 or index + length > self.stop or self.reserved & mask != mask:
+            raise ValueError('slots #{}-#{} are not reserved'.format(index, index + length - 1))
+        self.reserved &= ~mask
+
+    def is_reserved(self, index):
+        addr = index - self.start
+        return 0 <= addr < self.stop - self.start and bool(self.reserved >> addr & 1)
+
+    def stats(self):
+        size = self.stop - self.start
+        free = size - bin(self.reserved).count('1')
+        largest_run = 0
+        run = 0
+        for addr in range(size):
+            if self.reserved >> addr & 1:
+                run = 0
+            else:
+                run += 1
+                largest_run = max(largest_run, run)
+        return SlotStats(size, size - free, largest_run)
 
-    def is_reserved(self, addr):
-        return self.slots[addr-self.start] is RESERVED
+    def copy(self):
+        slots = Slots(self.start, self.stop)
+        slots.reserved = self.reserved
+        return slots
 
 
-RESERVED = object()
+@attr.s
+class SlotStats:
+    size = attr.ib()
+    reserved = attr.ib()
+    largest_free_run = attr.ib()
+
+    @property
+    def free(self):
+        return self.size - self.reserved
+
+    @property
+    def fragmentation(self):
+        """Share of free slots that are not in the largest run of them."""
+        if not self.free:
+            return 0.0
+        return 1 - self.largest_free_run / self.free
@@ -0,0 +1,159 @@
+from collections import Counter
+
+import attr
+
+from .ast import If, Label
+from .optimizer import is_goto
+from .target import DEFAULT_TARGET
+
+
+@attr.s
+class CostReport:
+    """Cost of statements a compiled module executes in a tick.
+
+    Statements and conditions cost as much as the target says. The
+    *worst* case runs every loop as many times as its bound allows and
+    enters every conditional statement. The *typical* case runs loops
+    without a known bound once and skips bodies of conditional
+    statements. *conditions* is the worst number of conditions
+    evaluated. *lines* maps file names and line numbers to the cost of
+    their statements in the worst case.
+    """
+
+    worst = attr.ib(default=0)
+    typical = attr.ib(default=0)
+    conditions = attr.ib(default=0)
+    lines = attr.ib(default=attr.Factory(Counter))
+    loops = attr.ib(default=attr.Factory(list))
+
+
+@attr.s
+class LoopCost:
+    """Loop that starts at a label and ends at the last jump back to it.
+
+    *bound* is the number of iterations, which is taken from the target
+    when the loop is not *bounded* by its sequence or a ``# bound: N``
+    comment. *worst* counts statements executed by all iterations,
+    including nested loops.
+    """
+
+    filename = attr.ib()
+    lineno = attr.ib()
+    start = attr.ib()
+    end = attr.ib()
+    bound = attr.ib()
+    bounded = attr.ib()
+    worst = attr.ib(default=0)
+
+
+def estimate_cost(module, target=DEFAULT_TARGET):
+    """Estimate statements executed by one run of the compiled module."""
+    body = module.body
+    loops = find_loops(body, target)
+
+    worst_runs = [1] * len(body)
+    typical_runs = [1] * len(body)
+    for loop in loops:
+        typical_bound = loop.bound if loop.bounded else 1
+        for i in range(loop.start, loop.end + 1):
+            worst_runs[i] *= loop.bound
+            typical_runs[i] *= typical_bound
+
+    report = CostReport(loops=loops)
+    worst_costs = []
+    for stmt, worst_run, typical_run in zip(body, worst_runs, typical_runs):
+        if isinstance(stmt, Label):
+            worst_costs.append(0)
+            continue
+        if isinstance(stmt, If):
+            typical_cost = target.condition_cost
+            cost = typical_cost + target.statement_cost * len(stmt.body)
+            report.conditions += worst_run
+        else:
+            cost = typical_cost = target.statement_cost
+        worst_costs.append(cost * worst_run)
+        report.worst += cost * worst_run
+        report.typical += typical_cost * typical_run
+        report.lines[stmt.filename, stmt.lineno] += cost * worst_run
+
+    for loop in loops:
+        loop.worst = sum(worst_costs[loop.start:loop.end + 1])
+    return report
+
+
+def find_loops(body, target=DEFAULT_TARGET):
+    """Return loops of the body in order of their labels."""
+    labels = {stmt.index: i for i, stmt in enumerate(body) if isinstance(stmt, Label)}
+    loops = {}
+    for i, stmt in enumerate(body):
+        for goto in iter_gotos(stmt):
+            start = labels.get(goto.index)
+            if start is None or start > i:
+                continue
+            loop = loops.get(start)
+            if loop is None:
+                label = body[start]
+                bounded = label.bound is not None
+                loops[start] = LoopCost(label.filename, label.lineno, start, i,
+                                        label.bound if bounded else target.loop_bound, bounded)
+            else:
+                loop.end = i
+
+    # Threaded jumps can leave an inner loop straight for the start of
+    # the outer one, so a loop must span the loops that start inside it
+    starts = sorted(loops)
+    for start in reversed(starts):
+        loop = loops[start]
+        for inner_start in starts:
+            if start < inner_start <= loop.end:
+                loop.end = max(loop.end, loops[inner_start].end)
+    return [loops[start] for start in starts]
+
+
+def iter_gotos(stmt):
+    if is_goto(stmt):
+        yield stmt
+    elif isinstance(stmt, If):
+        for body_stmt in stmt.body:
+            yield from iter_gotos(body_stmt)
+
+
+def check_tick_budget(module, target=DEFAULT_TARGET):
+    """Raise ValueError if compiled module may execute more statements
+    in a tick than the target allows.
+    """
+    if target.tick_budget is None:
+        return
+    report = estimate_cost(module, target)
+    if report.worst <= target.tick_budget:
+        return
+    lines = ['scenario may execute {} statements in a tick (limit {})'.format(report.worst, target.tick_budget),
+             'statements by source line:']
+    for location, cost in report.lines.most_common(10):
+        lines.append('  {}: {}'.format(format_location(*location), cost))
+    exc = ValueError('\n'.join(lines))
+    filename, exc._porcupy_lineno = report.lines.most_common(1)[0][0]
+    if filename is not None:
+        exc._porcupy_filename = filename
+    raise exc
+
+
+def format_cost_report(report):
+    lines = ['statements per tick: {} worst, {} typical; {} conditions'
+             .format(report.worst, report.typical, report.conditions)]
+    if report.loops:
+        lines.append('loops:')
+    for loop in report.loops:
+        lines.append('  {}: {} iterations{}, {} statements'
+                     .format(format_location(loop.filename, loop.lineno), loop.bound,
+                             '' if loop.bounded else ' (assumed)', loop.worst))
+    lines.append('statements by source line:')
+    for location, cost in sorted(report.lines.items(), key=lambda item: (str(item[0][0]), item[0][1] or 0)):
+        lines.append('  {}: {}'.format(format_location(*location), cost))
+    return '\n'.join(lines)
+
+
+def format_location(filename, lineno):
+    if filename is None:
+        return 'line {}'.format(lineno)
+    return '{}:{}'.format(filename, lineno)
@@ -0,0 +1,119 @@
+def emit(module, writer, width=None, encoding=None):
+    """Write the compiled module to *writer* line by line.
+
+    Lines are packed like in :func:`codewrap` and encoded with
+    *encoding* for binary writers. Only one line is kept in memory at a
+    time. Return number of characters and lines written, including line
+    breaks.
+    """
+    return write_lines(pack_lines(iter_pieces(module), width), writer, encoding)
+
+
+def write_lines(lines, writer, encoding=None):
+    chars = 0
+    count = 0
+    for line in lines:
+        line += '\n'
+        writer.write(line if encoding is None else line.encode(encoding))
+        chars += len(line)
+        count += 1
+    return chars, count
+
+
+def measure(module, width=None):
+    """Return number of characters and lines of the wrapped module,
+    without line break after the last line.
+    """
+    chars = 0
+    lines = 0
+    for line in pack_lines(iter_pieces(module), width):
+        chars += len(line) + 1
+        lines += 1
+    return chars - 1, lines
+
+
+def iter_pieces(module):
+    """Yield pieces of the scenario that lines can be broken between.
+
+    Statements are formatted one at a time, and bodies of conditional
+    statements are split too.
+    """
+    for stmt in module.body:
+        yield from str(stmt).split('  ')
+
+
+def codewrap(text, width):
+    stmts = text.split('  ')
+    if width is None:
+        return ' '.join(stmts)
+    return '\n'.join(pack_lines(stmts, width))
+
+
+def pack_lines(stmts, width):
+    """Pack statements into lines of given width.
+
+    Statements are joined with spaces, and a line is only broken
+    between statements. Statements must keep their order, so filling
+    each line before starting the next one gives the least number of
+    lines. A statement longer than *width* takes a line of its own.
+    Without *width* all statements are put on one line.
+    """
+    line = []
+    length = 0
+    for stmt in stmts:
+        if line and width is not None and length + 1 + len(stmt) > width:
+            yield ' '.join(line)
+            line = []
+        if line:
+            length += 1 + len(stmt)
+        else:
+            length = len(stmt)
+        line.append(stmt)
+    yield ' '.join(line)
+
+
+def place_pieces(module, width=None):
+    """Yield line, column, piece and statement for each piece of the
+    scenario, as the pieces are placed by :func:`pack_lines`.
+
+    Lines are numbered from 1 and columns from 0.
+    """
+    line = 1
+    length = None
+    for stmt in module.body:
+        for piece in str(stmt).split('  '):
+            if length is not None and width is not None and length + 1 + len(piece) > width:
+                line += 1
+                length = None
+            if length is None:
+                column = 0
+            else:
+                column = length + 1
+            length = column + len(piece)
+            yield line, column, piece, stmt
+
+
+def source_map(module, width=None, file=None):
+    """Map pieces of the wrapped scenario to source lines.
+
+    Each mapping is a list of scenario line, column and length of the
+    piece, followed by index of the source file in ``sources`` and the
+    source line, or None for both if the piece has no location.
+    """
+    sources = []
+    source_indices = {}
+    mappings = []
+    for line, column, piece, stmt in place_pieces(module, width):
+        source = None
+        if stmt.filename is not None:
+            source = source_indices.get(stmt.filename)
+            if source is None:
+                source = source_indices[stmt.filename] = len(sources)
+                sources.append(stmt.filename)
+        mappings.append([line, column, len(piece), source, stmt.lineno])
+    return {
+        'version': 1,
+        'file': file,
+        'sources': sources,
+        'mappings': mappings,
+    }
@@ -0,0 +1,359 @@
+import ast
+import hashlib
+import json
+import os
+import zlib
+
+import attr
+
+from .ast import Module, Assign, If, Const, Slot, EvolvedSlot, BinOp, Compare, BoolOp, Call, Label
+from .cache import compiler_digest
+from .compiler import NodeConverter, Scope, annotate_loop_bounds, visit_with_exc_wrapping
+from .metrics import measure_phase
+from .optimizer import PassManager, is_goto
+from .target import DEFAULT_TARGET
+from .types import ListPointer, NumberType, Slice
+
+MAIN = '__main__'
+
+# While a module is compiled its slots are numbered from 1 up to the
+# number of slots of the target. Object files move every index to the
+# segment of its module, so that slots of different modules can be told
+# apart when they are linked together.
+SEGMENT_SIZE = 10000
+
+# Temporaries are only used while the body of their module runs, so
+# modules share them. They are numbered in a segment of their own, which
+# no module name hashes to.
+TEMPORARY_SEGMENT = 999984
+
+
+@attr.s
+class ObjectFile:
+    name = attr.ib()
+    body = attr.ib()
+    exports = attr.ib()
+    imports = attr.ib()
+    slots = attr.ib()
+    labels = attr.ib()
+    temporaries = attr.ib()
+    list_items = attr.ib()
+    digest = attr.ib(default=None)
+
+
+@attr.s
+class Builder:
+    """Compile modules to object files and link them into a scenario.
+
+    Imported modules are looked up in *search_path*. Object files are
+    stored in *cache*, so only modules whose sources or imports changed
+    are compiled again. Phases of compilation are measured in
+    *metrics*.
+    """
+
+    search_path = attr.ib(default=attr.Factory(list))
+    cache = attr.ib(default=None)
+    target = attr.ib(default=DEFAULT_TARGET)
+    metrics = attr.ib(default=None)
+
+    compiled = attr.ib(default=attr.Factory(list), init=False)
+    _objects = attr.ib(default=attr.Factory(dict), init=False)
+    _order = attr.ib(default=attr.Factory(list), init=False)
+    _loading = attr.ib(default=attr.Factory(list), init=False)
+
+    def build(self, source, filename='<unknown>', opt_level=0, passes=None):
+        main = self.compile(MAIN, source, filename)
+        return link(self._order + [main], opt_level, passes, self.target, self.metrics)
+
+    def import_digests(self, source, filename='<unknown>'):
+        """Return digests of modules imported by the source."""
+        tree = ast.parse(source, filename)
+        return [obj.digest for obj in self.load_imports(tree, filename)]
+
+    def dependencies(self, source, filename='<unknown>'):
+        """Return paths of modules imported by the source, directly or not."""
+        paths = []
+        pending = [(source, filename)]
+        while pending:
+            source, filename = pending.pop()
+            try:
+                tree = ast.parse(source, filename)
+            except SyntaxError:
+                continue
+            for name, _ in find_imports(tree):
+                try:
+                    path = self.find(name)
+                except ImportError:
+                    continue
+                if path not in paths:
+                    paths.append(path)
+                    with open(path) as fp:
+                        pending.append((fp.read(), path))
+        return paths
+
+    def load(self, name):
+        obj = self._objects.get(name)
+        if obj is not None:
+            return obj
+        if name in self._loading:
+            raise ImportError("circular import: {}".format(' -> '.join(self._loading + [name])))
+
+        filename = self.find(name)
+        with open(filename) as fp:
+            source = fp.read()
+        self._loading.append(name)
+        try:
+            obj = self.compile(name, source, filename)
+        finally:
+            self._loading.pop()
+        self._objects[name] = obj
+        self._order.append(obj)
+        return obj
+
+    def find(self, name):
+        relative_path = os.path.join(*name.split('.')) + '.py'
+        for directory in self.search_path:
+            path = os.path.join(directory, relative_path)
+            if os.path.isfile(path):
+                return path
+        raise ImportError("no module named '{}'".format(name))
+
+    def compile(self, name, source, filename):
+        try:
+            with measure_phase(self.metrics, 'parse'):
+                tree = ast.parse(source, filename)
+                annotate_loop_bounds(tree, source)
+            imports = self.load_imports(tree, filename)
+            digest = object_digest(name, source, [obj.digest for obj in imports], self.target)
+
+            obj = None
+            if self.cache is not None:
+                obj = self.cache.get_object(digest)
+            if obj is None:
+                obj = compile_object(tree, name, filename, self.load, digest, self.target, self.metrics)
+                self.compiled.append(name)
+                if self.cache is not None:
+                    self.cache.put_object(digest, obj)
+            return obj
+        except Exception as exc:
+            if getattr(exc, '_porcupy_lineno', None) is not None and not hasattr(exc, '_porcupy_filename'):
+                exc._porcupy_filename = filename
+            raise
+
+    def load_imports(self, tree, filename):
+        # Imported modules are compiled first, because digest of the
+        # importing module depends on theirs
+        imports = []
+        for name, lineno in find_imports(tree):
+            try:
+                imports.append(self.load(name))
+            except Exception as exc:
+                if getattr(exc, '_porcupy_lineno', None) is None:
+                    exc._porcupy_lineno = lineno
+                    exc._porcupy_filename = filename
+                raise
+        return imports
+
+
+def search_path(filename):
+    if os.path.isfile(filename):
+        return [os.path.dirname(os.path.abspath(filename))]
+    return [os.getcwd()]
+
+
+def find_imports(tree):
+    """Yield names of modules imported by the module and line numbers."""
+    seen = set()
+    for stmt in tree.body:
+        if isinstance(stmt, ast.Import):
+            names = [alias.name for alias in stmt.names]
+        elif isinstance(stmt, ast.ImportFrom) and not stmt.level:
+            names = [stmt.module]
+        else:
+            continue
+        for name in names:
+            if name not in seen:
+                seen.add(name)
+                yield name, stmt.lineno
+
+
+def object_digest(name, source, import_digests, target=DEFAULT_TARGET):
+    payload = json.dumps({
+        'compiler': compiler_digest(),
+        'name': name,
+        'source': source,
+        'imports': import_digests,
+        'target': attr.astuple(target),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def compile_object(tree, name=MAIN, filename='<unknown>', importer=None, digest=None, target=DEFAULT_TARGET,
+                   metrics=None):
+    if target.numeric_slots >= SEGMENT_SIZE:
+        raise ValueError('targets with {} slots or more are not supported'.format(SEGMENT_SIZE))
+    converter = NodeConverter(importer=importer, target=target, filename=filename)
+    with measure_phase(metrics, 'convert'):
+        converted_tree = visit_with_exc_wrapping(converter, tree, filename)
+    scope = converter.scope
+    with measure_phase(metrics, 'allocate'):
+        for number, slot in enumerate(scope.temporary_slots, 1):
+            slot.index = TEMPORARY_SEGMENT * SEGMENT_SIZE + number
+    if metrics is not None:
+        metrics.reused_temporaries += scope.reused_temporaries
+
+    base = segment(name) * SEGMENT_SIZE
+
+    def virtual_index(index):
+        # Slots of imported modules are already in their segments
+        if index < SEGMENT_SIZE:
+            return base + index
+        return index
+
+    def same_label(index):
+        return index
+
+    body = [relocate(stmt, virtual_index, same_label) for stmt in converted_tree.body]
+    exports = {export_name: relocate(value, virtual_index, same_label)
+               for export_name, value in scope.names.maps[0].items()}
+    numeric_slots = scope.numeric_slots
+    slots = max((index for index in range(numeric_slots.start, numeric_slots.stop)
+                 if numeric_slots.is_reserved(index)), default=0)
+    return ObjectFile(
+        name=name,
+        body=body,
+        exports=exports,
+        imports=[import_name for import_name, _ in find_imports(tree)],
+        slots=slots,
+        labels=converter.last_label,
+        temporaries=sorted(slot.index for slot in scope.temporary_slots),
+        list_items=sorted(virtual_index(index) for index in scope.list_item_slots),
+        digest=digest,
+    )
+
+
+def segment(name):
+    return zlib.crc32(name.encode('utf-8')) % 999983 + 1
+
+
+def link(objects, opt_level=0, passes=None, target=DEFAULT_TARGET, metrics=None):
+    """Merge object files into one module and optimize it.
+
+    Modules must come after the modules they import. Their bodies run in
+    that order, so imported modules run before the modules importing
+    them. Slots and labels are relocated to follow each other, and
+    temporaries of all modules share slots after them.
+    """
+    if passes is None:
+        pass_manager = PassManager.from_level(opt_level)
+    else:
+        pass_manager = PassManager(passes)
+
+    slot_bases = {}
+    label_bases = {}
+    segment_names = {}
+    last_slot = 0
+    last_label = 0
+    for obj in objects:
+        obj_segment = segment(obj.name)
+        if obj_segment in segment_names:
+            raise ImportError("cannot link modules '{}' and '{}' together, rename one of them"
+                              .format(segment_names[obj_segment], obj.name))
+        segment_names[obj_segment] = obj.name
+        slot_bases[obj_segment] = last_slot
+        label_bases[obj.name] = last_label
+        last_slot += obj.slots
+        last_label += obj.labels
+    slot_bases[TEMPORARY_SEGMENT] = last_slot
+    last_slot += max((len(obj.temporaries) for obj in objects), default=0)
+    if last_slot > target.numeric_slots:
+        raise MemoryError('ran out of variable slots')
+    if last_label > target.labels:
+        raise ValueError('ran out of jump labels')
+
+    def physical_index(index):
+        obj_segment, local_index = divmod(index, SEGMENT_SIZE)
+        try:
+            return slot_bases[obj_segment] + local_index
+        except KeyError:
+            raise ImportError('slot #{} belongs to a module that is not linked'.format(index)) from None
+
+    body = []
+    scope = Scope.for_target(target)
+    with measure_phase(metrics, 'link'):
+        for obj in objects:
+            label_base = label_bases[obj.name]
+
+            def physical_label(index):
+                return label_base + index
+
+            body.extend(relocate(stmt, physical_index, physical_label) for stmt in obj.body)
+            scope.list_item_slots.update(physical_index(index) for index in obj.list_items)
+
+        temporaries = range(slot_bases[TEMPORARY_SEGMENT] + 1, last_slot + 1)
+        scope.temporary_slots.extend(Slot('p', index, 'z', NumberType()) for index in temporaries)
+
+    with measure_phase(metrics, 'optimize'):
+        module = pass_manager.run(Module(body), scope)
+    if metrics is not None:
+        metrics.converted_stmts += len(body)
+        metrics.emitted_stmts += len(module.body)
+        metrics.slots += last_slot
+        metrics.labels += last_label
+        metrics.temporaries += len(scope.temporary_slots)
+    return module
+
+
+def relocate(node, slot_func, label_func):
+    """Rebuild the node with variable slots and labels renumbered.
+
+    List pointers are constants holding slot numbers, so they are
+    renumbered as well.
+    """
+    if isinstance(node, Slot):
+        if is_goto(node):
+            return attr.evolve(node, index=label_func(node.index))
+        if node.register == 'p' and node.index is not None:
+            return attr.evolve(node, index=slot_func(node.index))
+        return node
+    elif isinstance(node, EvolvedSlot):
+        return EvolvedSlot(relocate(node._original, slot_func, label_func), **dict(node._changes))
+    elif isinstance(node, Label):
+        return attr.evolve(node, index=label_func(node.index))
+    elif isinstance(node, Const):
+        changes = {}
+        if isinstance(node.value, list):
+            changes['value'] = [relocate(item, slot_func, label_func) for item in node.value]
+        elif isinstance(node.type, ListPointer) and isinstance(node.value, int):
+            changes['value'] = slot_func(node.value)
+        elif isinstance(node.type, Slice) and isinstance(node.value, int):
+            # pointer * 10000 + capacity * 100 + length
+            pointer, rest = divmod(node.value, 10000)
+            changes['value'] = slot_func(pointer) * 10000 + rest
+        if node.metadata:
+            changes['metadata'] = {key: relocate(value, slot_func, label_func)
+                                   for key, value in node.metadata.items()}
+        if not changes:
+            return node
+        return attr.evolve(node, **changes)
+    elif isinstance(node, Assign):
+        return attr.evolve(node, target=relocate(node.target, slot_func, label_func),
+                           value=relocate(node.value, slot_func, label_func))
+    elif isinstance(node, If):
+        return attr.evolve(node, test=relocate(node.test, slot_func, label_func),
+                           body=[relocate(stmt, slot_func, label_func) for stmt in node.body])
+    elif isinstance(node, BinOp):
+        result = BinOp(relocate(node.left, slot_func, label_func), node.op,
+                       relocate(node.right, slot_func, label_func))
+        # Pointer arithmetic gives its result the type of pointer
+        result.type = node.type
+        return result
+    elif isinstance(node, Compare):
+        return attr.evolve(node, left=relocate(node.left, slot_func, label_func),
+                           right=relocate(node.right, slot_func, label_func))
+    elif isinstance(node, BoolOp):
+        return attr.evolve(node, values=[relocate(value, slot_func, label_func) for value in node.values])
+    elif isinstance(node, Call):
+        return attr.evolve(node, func=relocate(node.func, slot_func, label_func),
+                           args=[relocate(arg, slot_func, label_func) for arg in node.args])
+    return node
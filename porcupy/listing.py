@@ -0,0 +1,84 @@
+from collections import OrderedDict, defaultdict
+
+import attr
+
+from .emitter import place_pieces
+from .optimizer import iter_slots
+
+
+@attr.s
+class ListedStatement:
+    """Statement of the scenario with its size, the variable slots it
+    touches and the line of the wrapped scenario it starts on.
+    """
+
+    stmt = attr.ib()
+    chars = attr.ib()
+    slots = attr.ib()
+    line = attr.ib()
+
+
+def list_statements(module, width=None):
+    """Group statements of the module by source file and line.
+
+    Files come in order of their first statement in the scenario.
+    """
+    files = OrderedDict()
+    placements = place_pieces(module, width)
+    for stmt in module.body:
+        pieces = str(stmt).split('  ')
+        line, _, _, _ = next(placements)
+        for _ in pieces[1:]:
+            next(placements)
+        slots = sorted({(slot.register, slot.index) for slot in iter_slots(stmt) if slot.is_variable()},
+                       key=lambda slot: (slot[0], slot[1] is None, slot[1] or 0))
+        listed = ListedStatement(stmt, len(' '.join(pieces)),
+                                 ['{}{}'.format(register, '' if index is None else index)
+                                  for register, index in slots],
+                                 line)
+        files.setdefault(stmt.filename, defaultdict(list))[stmt.lineno].append(listed)
+    return files
+
+
+def format_listing(module, width=None, sources=None):
+    """Print source lines next to statements they compile to.
+
+    Source text of each file is taken from *sources* by file name, or
+    read from the file. Lines without statements are listed too.
+    """
+    if sources is None:
+        sources = {}
+    result = []
+    for filename, lines in list_statements(module, width).items():
+        source_lines = read_source_lines(filename, sources)
+        result.append('; {}'.format(filename))
+        result.append(';{:>9} {:>6}  {:<12} {}'.format('map line', 'chars', 'slots', 'statement'))
+        linenos = sorted(lineno for lineno in lines if lineno is not None)
+        if source_lines and linenos:
+            linenos = range(1, max(len(source_lines), linenos[-1]) + 1)
+        for lineno in linenos:
+            text = source_lines[lineno-1] if lineno <= len(source_lines) else ''
+            result.append('{:>4}  {}'.format(lineno, text).rstrip())
+            result.extend(format_statements(lines.get(lineno, ())))
+        if None in lines:
+            result.append('   ?')
+            result.extend(format_statements(lines[None]))
+    return '\n'.join(result)
+
+
+def format_statements(listed_stmts):
+    for listed in listed_stmts:
+        yield '{:>10} {:>6}  {:<12} {}'.format(listed.line, listed.chars, ' '.join(listed.slots), listed.stmt)
+
+
+def read_source_lines(filename, sources):
+    source = sources.get(filename)
+    if source is None and filename is not None:
+        try:
+            with open(filename) as fp:
+                source = fp.read()
+        except OSError:
+            pass
+    if source is None:
+        return []
+    return source.splitlines()
@@ -0,0 +1,55 @@
+from collections import OrderedDict
+from contextlib import contextmanager
+import time
+
+import attr
+
+from .ast import Label
+
+
+@attr.s
+class Metrics:
+    """Measurements of a compilation.
+
+    *times* maps phases to seconds spent in them: ``parse``,
+    ``convert``, ``allocate``, ``link``, ``optimize`` and ``emit``.
+    Statements are counted before and after optimization. *slots* and
+    *labels* are the most numeric slots and labels the scenario takes
+    before optimization. *memory_peak* is only measured while
+    :mod:`tracemalloc` is tracing.
+    """
+
+    times = attr.ib(default=attr.Factory(OrderedDict))
+    converted_stmts = attr.ib(default=0)
+    emitted_stmts = attr.ib(default=0)
+    slots = attr.ib(default=0)
+    labels = attr.ib(default=0)
+    temporaries = attr.ib(default=0)
+    reused_temporaries = attr.ib(default=0)
+    chars = attr.ib(default=0)
+    lines = attr.ib(default=0)
+    memory_peak = attr.ib(default=None)
+
+    def count_converted(self, module, scope):
+        self.converted_stmts += len(module.body)
+        self.labels += sum(1 for stmt in module.body if isinstance(stmt, Label))
+        self.slots += scope.numeric_slots.stats().reserved
+        self.temporaries += len(scope.temporary_slots)
+        self.reused_temporaries += scope.reused_temporaries
+
+    def count_output(self, output):
+        self.chars = len(output)
+        self.lines = output.count('\n') + 1
+
+
+@contextmanager
+def measure_phase(metrics, phase):
+    """Add time spent in the block to *metrics*, if given."""
+    if metrics is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.times[phase] = metrics.times.get(phase, 0) + time.perf_counter() - start
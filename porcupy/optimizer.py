@@ -0,0 +1,450 @@
+import ast
+from collections import Counter
+import logging
+import time
+
+import attr
+
+from .ast import (Module, Assign, If, Const, Slot, EvolvedSlot, BoolOp, BinOp,
+                  Add, Sub, Mult, Div, Compare, Call, Label)
+
+logger = logging.getLogger(__name__)
+
+PASSES = {}
+
+
+def register_pass(name):
+    def decorator(func):
+        PASSES[name] = func
+        return func
+    return decorator
+
+
+@attr.s
+class PassManager:
+    passes = attr.ib()
+    timings = attr.ib(default=attr.Factory(list))
+
+    @classmethod
+    def from_level(cls, opt_level):
+        try:
+            passes = PIPELINES[str(opt_level)]
+        except KeyError:
+            raise ValueError("unknown optimization level '{}'".format(opt_level)) from None
+        return cls(passes)
+
+    def __attrs_post_init__(self):
+        for name in self.passes:
+            if name not in PASSES:
+                raise ValueError("unknown optimization pass '{}'".format(name))
+
+    def run(self, module, scope):
+        body = module.body
+        for name in self.passes:
+            size = len(body)
+            start = time.perf_counter()
+            body = PASSES[name](body, scope)
+            elapsed = time.perf_counter() - start
+            self.timings.append((name, elapsed))
+            logger.debug('%s: %.3f ms, %d -> %d statements', name, elapsed * 1000, size, len(body))
+        return Module(body)
+
+
+@register_pass('remove-dead-code')
+def remove_dead_code(body, scope):
+    while True:
+        size = len(body)
+        body = remove_unreachable(body)
+        body = remove_redundant_jumps(body)
+        body = remove_unused_labels(body)
+        if len(body) == size:
+            return body
+
+
+def remove_unreachable(body):
+    # g1z p1z 5 :1 -> g1z :1
+    result = []
+    reachable = True
+    for stmt in body:
+        if isinstance(stmt, Label):
+            reachable = True
+        if reachable:
+            result.append(stmt)
+        if is_goto(stmt):
+            reachable = False
+    return result
+
+
+def remove_redundant_jumps(body):
+    # g1z :1 -> :1
+    # # p1z > 0 ( g1z ) :1 -> :1
+    result = []
+    for i, stmt in enumerate(body):
+        label = jump_target(stmt)
+        if label is not None and label in following_labels(body, i+1):
+            continue
+        result.append(stmt)
+    return result
+
+
+def jump_target(stmt):
+    if is_goto(stmt):
+        return stmt.index
+    elif isinstance(stmt, If) and len(stmt.body) == 1 and is_goto(stmt.body[0]):
+        return stmt.body[0].index
+
+
+def following_labels(body, start):
+    labels = set()
+    for stmt in body[start:]:
+        if not isinstance(stmt, Label):
+            break
+        labels.add(stmt.index)
+    return labels
+
+
+def remove_unused_labels(body):
+    used = {stmt.index for stmt in iter_stmts(body) if is_goto(stmt)}
+    return [stmt for stmt in body
+            if not isinstance(stmt, Label) or stmt.index in used]
+
+
+@register_pass('thread-jumps')
+def thread_jumps(body, scope):
+    # g1z ... :1 g2z -> g2z ... :1 g2z
+    forwards = {}
+    for i, stmt in enumerate(body):
+        if isinstance(stmt, Label):
+            following = next((stmt for stmt in body[i+1:] if not isinstance(stmt, Label)), None)
+            if is_goto(following):
+                forwards[stmt.index] = following.index
+
+    def final_target(label):
+        seen = {label}
+        while label in forwards and forwards[label] not in seen:
+            label = forwards[label]
+            seen.add(label)
+        return label
+
+    def thread(stmt):
+        if is_goto(stmt):
+            return attr.evolve(stmt, index=final_target(stmt.index))
+        return stmt
+
+    return map_stmts(body, thread)
+
+
+@register_pass('invert-branches')
+def invert_branches(body, scope):
+    # # p1z > 0 ( g1z ) g2z :1 -> # p1z <= 0 ( g2z ) :1
+    result = []
+    i = 0
+    while i < len(body):
+        stmt = body[i]
+        if (i+2 < len(body) and is_conditional_goto(stmt) and isinstance(stmt.test, Compare) and
+                is_goto(body[i+1]) and stmt.body[0].index in following_labels(body, i+2)):
+            test = attr.evolve(stmt.test, op=NEGATED_COMPARISONS[type(stmt.test.op)]())
+            result.append(attr.evolve(stmt, test=test, body=[body[i+1]]))
+            i += 2
+            continue
+        result.append(stmt)
+        i += 1
+    return result
+
+
+NEGATED_COMPARISONS = {
+    ast.Eq: ast.NotEq,
+    ast.NotEq: ast.Eq,
+    ast.Lt: ast.GtE,
+    ast.LtE: ast.Gt,
+    ast.Gt: ast.LtE,
+    ast.GtE: ast.Lt,
+}
+
+
+@register_pass('coalesce-temporaries')
+def coalesce_temporaries(body, scope):
+    """Compute values straight into variables instead of temporaries.
+
+    # p1z > 0 ( p3z 1 ) p2z p3z -> # p1z > 0 ( p2z 1 )
+    p3z p1z+2 p2z p3z+3 -> p2z p1z+2 p2z p2z+3
+
+    A temporary that is read only once, by an assignment to a plain
+    variable, is replaced with that variable in the straight run of
+    statements that computes it, when nothing else in the run touches
+    the variable.
+    """
+    temporaries = {slot.index for slot in scope.temporary_slots}
+    reads = Counter()
+    for stmt in body:
+        for slot in iter_read_slots(stmt):
+            if slot.register == 'p':
+                reads[slot.index] += 1
+
+    body = list(body)
+    j = 0
+    while j < len(body):
+        run = coalescable_run(body, j, temporaries, reads, scope)
+        if run is None:
+            j += 1
+            continue
+
+        start, temp = run
+        dest = body[j].target.index
+
+        def rename(slot):
+            if slot.register == 'p' and slot.index == temp:
+                return attr.evolve(slot, index=dest)
+            return slot
+
+        renamed = [replace_slots(stmt, rename) for stmt in body[start:j+1]]
+        if str(renamed[-1].target) == str(renamed[-1].value):
+            renamed.pop()
+        body[start:j+1] = renamed
+        reads[temp] = 0
+        j = start + len(renamed)
+    return body
+
+
+def coalescable_run(body, j, temporaries, reads, scope):
+    stmt = body[j]
+    if not isinstance(stmt, Assign) or not is_plain_slot(stmt.target):
+        return
+    dest = stmt.target.index
+    if dest in temporaries or dest in scope.list_item_slots or dest in slot_indices(stmt.value):
+        return
+
+    operands = [stmt.value]
+    if isinstance(stmt.value, BinOp):
+        operands = [stmt.value.left, stmt.value.right]
+    for operand in operands:
+        if is_plain_slot(operand) and operand.index in temporaries and reads[operand.index] == 1:
+            start = run_start(body, j, operand.index, dest)
+            if start is not None:
+                return start, operand.index
+
+
+def run_start(body, j, temp, dest):
+    start = j
+    while start > 0 and not isinstance(body[start-1], Label) and not has_gotos(body[start-1]):
+        start -= 1
+    while start < j and temp not in slot_indices(body[start]):
+        start += 1
+
+    # The run must begin by overwriting the temporary, and may read the
+    # variable only before that
+    first = body[start]
+    if start == j or not (isinstance(first, Assign) and is_plain_slot(first.target) and first.target.index == temp):
+        return
+    if any(dest in slot_indices(prev) for prev in body[start+1:j]):
+        return
+    return start
+
+
+def is_plain_slot(node):
+    return isinstance(node, Slot) and node.register == 'p' and not node.ref and not node.short_form
+
+
+def has_gotos(stmt):
+    return any(is_goto(nested) for nested in iter_stmts([stmt]))
+
+
+def slot_indices(stmt):
+    return {slot.index for slot in iter_slots(stmt) if slot.register == 'p'}
+
+
+def iter_read_slots(stmt):
+    for nested in iter_stmts([stmt]):
+        if isinstance(nested, Assign):
+            if not is_plain_slot(nested.target):
+                yield from iter_slots(nested.target)
+            yield from iter_slots(nested.value)
+        elif isinstance(nested, If):
+            yield from iter_slots(nested.test)
+        else:
+            yield from iter_slots(nested)
+
+
+@register_pass('renumber-labels')
+def renumber_labels(body, scope):
+    # Shorter label numbers make both labels and gotos shorter
+    numbers = {}
+    for stmt in body:
+        if isinstance(stmt, Label):
+            numbers[stmt.index] = len(numbers) + 1
+
+    def renumber(stmt):
+        if isinstance(stmt, Label) or is_goto(stmt):
+            return attr.evolve(stmt, index=numbers[stmt.index])
+        return stmt
+
+    return map_stmts(body, renumber)
+
+
+@register_pass('fold-identity-ops')
+def fold_identity_ops(body, scope):
+    # p1z p2z+0 -> p1z p2z
+    # p1z p2z*1 -> p1z p2z
+    def fold(stmt):
+        if isinstance(stmt, Assign) and is_identity_op(stmt.value):
+            return attr.evolve(stmt, value=stmt.value.left)
+        return stmt
+
+    return map_stmts(body, fold)
+
+
+def is_identity_op(expr):
+    if not isinstance(expr, BinOp) or not isinstance(expr.right, Const):
+        return False
+    if isinstance(expr.op, (Add, Sub)):
+        return expr.right.value == 0
+    elif isinstance(expr.op, (Mult, Div)):
+        return expr.right.value == 1
+    return False
+
+
+@register_pass('remove-self-assigns')
+def remove_self_assigns(body, scope):
+    # p1z p1z ->
+    result = []
+    for stmt in body:
+        if isinstance(stmt, If):
+            stmt_body = remove_self_assigns(stmt.body, scope)
+            if not stmt_body:
+                continue
+            stmt = attr.evolve(stmt, body=stmt_body)
+        elif isinstance(stmt, Assign) and str(stmt.target) == str(stmt.value):
+            continue
+        result.append(stmt)
+    return result
+
+
+@register_pass('renumber-slots')
+def renumber_slots(body, scope):
+    """Give the most frequently used variables the shortest slot numbers.
+
+    Slots holding list items are left in place, because they are
+    addressed by pointers.
+    """
+    usage = Counter()
+    for stmt in body:
+        for slot in iter_slots(stmt):
+            if is_movable(slot, scope):
+                usage[slot.index] += 1
+
+    indices = sorted(usage)
+    by_frequency = sorted(indices, key=lambda index: (-usage[index], index))
+    numbers = dict(zip(by_frequency, indices))
+
+    def renumber(slot):
+        if is_movable(slot, scope):
+            return attr.evolve(slot, index=numbers[slot.index])
+        return slot
+
+    return [replace_slots(stmt, renumber) for stmt in body]
+
+
+def is_movable(slot, scope):
+    return (slot.register == 'p' and slot.index is not None and
+            slot.index not in scope.list_item_slots)
+
+
+PIPELINES = {
+    '0': [],
+    '1': ['remove-dead-code', 'fold-identity-ops', 'remove-self-assigns'],
+    '2': ['thread-jumps', 'invert-branches', 'remove-dead-code', 'fold-identity-ops', 'remove-self-assigns'],
+    '3': ['thread-jumps', 'invert-branches', 'remove-dead-code', 'fold-identity-ops', 'coalesce-temporaries',
+          'remove-self-assigns'],
+    's': ['thread-jumps', 'invert-branches', 'remove-dead-code', 'fold-identity-ops', 'coalesce-temporaries',
+          'remove-self-assigns', 'renumber-labels', 'renumber-slots'],
+}
+
+
+def is_goto(stmt):
+    return isinstance(stmt, Slot) and stmt.register == 'g'
+
+
+def is_conditional_goto(stmt):
+    return isinstance(stmt, If) and len(stmt.body) == 1 and is_goto(stmt.body[0])
+
+
+def iter_stmts(body):
+    for stmt in body:
+        yield stmt
+        if isinstance(stmt, If):
+            yield from iter_stmts(stmt.body)
+
+
+def map_stmts(body, func):
+    result = []
+    for stmt in body:
+        if isinstance(stmt, If):
+            stmt = attr.evolve(stmt, body=map_stmts(stmt.body, func))
+        result.append(func(stmt))
+    return result
+
+
+def iter_slots(node):
+    """Yield every variable slot referenced by the node.
+
+    Evolved slots are unwrapped to the slots they were derived from.
+    """
+    if isinstance(node, Slot):
+        if not is_goto(node):
+            yield node
+    elif isinstance(node, EvolvedSlot):
+        yield node._original
+    elif isinstance(node, Const):
+        if isinstance(node.value, list):
+            for item in node.value:
+                yield from iter_slots(item)
+    elif isinstance(node, Assign):
+        yield from iter_slots(node.target)
+        yield from iter_slots(node.value)
+    elif isinstance(node, If):
+        yield from iter_slots(node.test)
+        for stmt in node.body:
+            yield from iter_slots(stmt)
+    elif isinstance(node, (BinOp, Compare)):
+        yield from iter_slots(node.left)
+        yield from iter_slots(node.right)
+    elif isinstance(node, BoolOp):
+        for value in node.values:
+            yield from iter_slots(value)
+    elif isinstance(node, Call):
+        yield from iter_slots(node.func)
+        for arg in node.args:
+            yield from iter_slots(arg)
+
+
+def replace_slots(node, func):
+    """Rebuild the node with every variable slot passed through *func*."""
+    if isinstance(node, Slot):
+        if is_goto(node):
+            return node
+        return func(node)
+    elif isinstance(node, EvolvedSlot):
+        original = func(node._original)
+        if original is node._original:
+            return node
+        return EvolvedSlot(original, **dict(node._changes))
+    elif isinstance(node, Const):
+        if isinstance(node.value, list):
+            return attr.evolve(node, value=[replace_slots(item, func) for item in node.value])
+        return node
+    elif isinstance(node, Assign):
+        return attr.evolve(node, target=replace_slots(node.target, func), value=replace_slots(node.value, func))
+    elif isinstance(node, If):
+        return attr.evolve(node, test=replace_slots(node.test, func),
+                           body=[replace_slots(stmt, func) for stmt in node.body])
+    elif isinstance(node, BinOp):
+        # BinOp infers its type from the operands, which keep their types
+        return BinOp(replace_slots(node.left, func), node.op, replace_slots(node.right, func))
+    elif isinstance(node, Compare):
+        return attr.evolve(node, left=replace_slots(node.left, func), right=replace_slots(node.right, func))
+    elif isinstance(node, BoolOp):
+        return attr.evolve(node, values=[replace_slots(value, func) for value in node.values])
+    elif isinstance(node, Call):
+        return attr.evolve(node, func=replace_slots(node.func, func),
+                           args=[replace_slots(arg, func) for arg in node.args])
+    return node
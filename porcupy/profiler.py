@@ -0,0 +1,184 @@
+from contextlib import contextmanager
+import functools
+import marshal
+import threading
+import time
+
+import attr
+
+from . import types
+from .compiler import NodeConverter, builtin_names
+from .types import CallableType, Formatter, Type
+
+# Methods that types implement to compile operations on their values
+TYPE_HOOKS = ('_bin_op', '_unary_op', '_getattr', '_getitem', '_setitem', '_call', '_len', '_truthy')
+
+_MISSING = object()
+
+
+@attr.s
+class FunctionStats:
+    """Calls of a profiled function and time spent in them.
+
+    *own_time* excludes time spent in other profiled functions, and
+    *total_time* includes it. Recursive calls are counted in *calls*,
+    but not in *primitive_calls* and *total_time*. *callers* maps keys
+    of calling functions to the same numbers for calls made by each.
+    """
+
+    key = attr.ib()
+    calls = attr.ib(default=0)
+    primitive_calls = attr.ib(default=0)
+    own_time = attr.ib(default=0.0)
+    total_time = attr.ib(default=0.0)
+    callers = attr.ib(default=attr.Factory(dict))
+    active = attr.ib(default=0, repr=False)
+
+    @property
+    def name(self):
+        return self.key[2]
+
+
+@attr.s
+class Profiler:
+    """Count calls of converter visitors and type hooks, and measure
+    time spent in them.
+
+    Functions are only instrumented inside the :meth:`instrument`
+    block. Formatting of strings and checking of function arguments are
+    profiled too, because they take much of the time of some visitors.
+
+    Instrumented functions are shared by the whole process, but only
+    calls made by the thread that entered the block are profiled.
+    Compilations running in other threads at the same time call the
+    functions as usual and are left out of the stats.
+    """
+
+    timer = attr.ib(default=time.perf_counter)
+    stats = attr.ib(default=attr.Factory(dict), init=False)
+    _stack = attr.ib(default=attr.Factory(list), init=False)
+    _thread = attr.ib(default=None, init=False)
+
+    @contextmanager
+    def instrument(self):
+        if self._thread is not None:
+            raise RuntimeError('profiler is already instrumenting functions')
+        patches = []
+
+        def patch(owner, name, func, label=None):
+            patches.append((owner, name, vars(owner).get(name, _MISSING)))
+            setattr(owner, name, self.wrap(func, label))
+
+        visitors = NodeConverter.visitors
+        patches.append((NodeConverter, 'visitors', visitors))
+        NodeConverter.visitors = {node_class: self.wrap(visitor) for node_class, visitor in visitors.items()}
+
+        for type_class in iter_subclasses(Type):
+            for hook in TYPE_HOOKS:
+                if hook in vars(type_class):
+                    patch(type_class, hook, vars(type_class)[hook])
+        # Builtin functions have their own call methods
+        for name, slot in builtin_names().items():
+            if isinstance(slot.type, CallableType) and '_call' in vars(slot.type):
+                patch(slot.type, '_call', slot.type._call, '{}._call'.format(name))
+        patch(Formatter, 'vformat', Formatter.vformat)
+        patch(types, 'check_func_args', types.check_func_args)
+
+        self._thread = threading.get_ident()
+        try:
+            yield self
+        finally:
+            for owner, name, original in reversed(patches):
+                if original is _MISSING:
+                    delattr(owner, name)
+                else:
+                    setattr(owner, name, original)
+            self._thread = None
+
+    def wrap(self, func, name=None):
+        code = getattr(func, '__func__', func).__code__
+        key = (code.co_filename, code.co_firstlineno, name or func.__qualname__)
+        timer = self.timer
+
+        @functools.wraps(func)
+        def profiled(*args, **kwargs):
+            if threading.get_ident() != self._thread:
+                return func(*args, **kwargs)
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = FunctionStats(key)
+            caller = self._stack[-1] if self._stack else None
+            # Time spent in profiled functions called by this one
+            frame = [stats, 0.0]
+            self._stack.append(frame)
+            stats.active += 1
+            start = timer()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                elapsed = timer() - start
+                self._stack.pop()
+                stats.active -= 1
+                own_time = elapsed - frame[1]
+                primitive = stats.active == 0
+                record_call(stats, own_time, elapsed, primitive)
+                if caller is not None:
+                    caller[1] += elapsed
+                    edge = stats.callers.get(caller[0].key)
+                    if edge is None:
+                        edge = stats.callers[caller[0].key] = FunctionStats(caller[0].key)
+                    record_call(edge, own_time, elapsed, primitive)
+
+        return profiled
+
+    def sorted_stats(self, sort='total'):
+        """Return stats of called functions, most expensive first.
+
+        Sort by *sort* key, which is one of ``total``, ``own`` or
+        ``calls``.
+        """
+        sort_keys = {
+            'total': lambda stats: stats.total_time,
+            'own': lambda stats: stats.own_time,
+            'calls': lambda stats: stats.calls,
+        }
+        if sort not in sort_keys:
+            raise ValueError("unknown sort key '{}', expected one of: {}".format(sort, ', '.join(sorted(sort_keys))))
+        return sorted(self.stats.values(), key=sort_keys[sort], reverse=True)
+
+    def format_report(self, sort='total', limit=None):
+        lines = ['{:>9} {:>10} {:>10} {:>12}  {}'.format('calls', 'total s', 'own s', 'per call us', 'function')]
+        for stats in self.sorted_stats(sort)[:limit]:
+            lines.append('{:>9} {:>10.4f} {:>10.4f} {:>12.1f}  {}'.format(
+                stats.calls, stats.total_time, stats.own_time, stats.own_time / stats.calls * 1e6, stats.name))
+        return '\n'.join(lines)
+
+    def dump(self, path):
+        """Write stats to a file that :class:`pstats.Stats` can load."""
+        pstats = {}
+        for key, stats in self.stats.items():
+            callers = {caller_key: (edge.calls, edge.primitive_calls, edge.own_time, edge.total_time)
+                       for caller_key, edge in stats.callers.items()}
+            pstats[key] = (stats.primitive_calls, stats.calls, stats.own_time, stats.total_time, callers)
+        with open(path, 'wb') as fp:
+            marshal.dump(pstats, fp)
+
+
+def record_call(stats, own_time, total_time, primitive):
+    stats.calls += 1
+    stats.own_time += own_time
+    if primitive:
+        stats.primitive_calls += 1
+        stats.total_time += total_time
+
+
+def iter_subclasses(cls):
+    seen = set()
+    pending = [cls]
+    while pending:
+        cls = pending.pop()
+        if cls in seen:
+            continue
+        seen.add(cls)
+        yield cls
+        pending.extend(cls.__subclasses__())
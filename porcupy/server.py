@@ -0,0 +1,236 @@
+import ast
+import inspect
+import json
+import traceback
+
+import attr
+
+from . import linker
+from .cli import check_budget, line_costs
+from .compiler import compile_module
+from .cost import check_tick_budget
+from .emitter import iter_pieces, measure, pack_lines
+from .session import Session
+from .target import DEFAULT_TARGET
+
+PARSE_ERROR = -32700
+INVALID_REQUEST = -32600
+METHOD_NOT_FOUND = -32601
+INVALID_PARAMS = -32602
+INTERNAL_ERROR = -32603
+
+
+@attr.s
+class Buffer:
+    path = attr.ib()
+    text = attr.ib(default='')
+    session = attr.ib(default=attr.Factory(Session))
+
+
+@attr.s
+class Server:
+    """Compile buffers on JSON-RPC requests.
+
+    Messages are framed with ``Content-Length`` headers, like in the
+    Language Server Protocol. Every request names a buffer by *path* and
+    may send its new *text*. Buffers keep their sessions between
+    requests, so only statements that changed are converted again.
+
+    Methods:
+
+    - ``compile`` returns the scenario, its size, characters added by
+      each line of the buffer and diagnostics;
+    - ``estimate`` returns everything but the scenario;
+    - ``check`` returns only diagnostics;
+    - ``close`` forgets the buffer;
+    - ``shutdown`` stops the server after replying.
+    """
+
+    reader = attr.ib()
+    writer = attr.ib()
+    cache = attr.ib(default=None)
+    target = attr.ib(default=DEFAULT_TARGET)
+
+    buffers = attr.ib(default=attr.Factory(dict), init=False)
+    running = attr.ib(default=True, init=False)
+
+    def serve(self):
+        while self.running:
+            try:
+                body = read_message(self.reader)
+            except ValueError as exc:
+                self.send(error_response(None, PARSE_ERROR, str(exc)))
+                continue
+            if body is None:
+                break
+            response = self.handle(body)
+            if response is not None:
+                self.send(response)
+
+    def send(self, response):
+        write_message(self.writer, response)
+
+    def handle(self, body):
+        try:
+            message = json.loads(body.decode('utf-8'))
+        except ValueError as exc:
+            return error_response(None, PARSE_ERROR, str(exc))
+        if not isinstance(message, dict) or not isinstance(message.get('method'), str):
+            return error_response(None, INVALID_REQUEST, 'expected an object with method')
+
+        request_id = message.get('id')
+        handler = getattr(self, 'rpc_' + message['method'], None)
+        if handler is None:
+            response = error_response(request_id, METHOD_NOT_FOUND,
+                                      "unknown method '{}'".format(message['method']))
+        else:
+            params = message.get('params', {})
+            try:
+                if not isinstance(params, dict):
+                    raise TypeError('expected params to be an object')
+                inspect.signature(handler).bind(**params)
+            except TypeError as exc:
+                response = error_response(request_id, INVALID_PARAMS, str(exc))
+            else:
+                response = self.call(request_id, handler, params)
+
+        # Notifications are not answered
+        if 'id' not in message:
+            return
+        return response
+
+    def call(self, request_id, handler, params):
+        try:
+            result = handler(**params)
+        except Exception as exc:
+            return error_response(request_id, INTERNAL_ERROR, str(exc), traceback.format_exc())
+        return {'jsonrpc': '2.0', 'id': request_id, 'result': result}
+
+    def rpc_compile(self, path, text=None, opt_level='0', passes=None, width=None):
+        return self.build(path, text, opt_level, passes, width)
+
+    def rpc_estimate(self, path, text=None, opt_level='0', passes=None):
+        result = self.build(path, text, opt_level, passes)
+        result.pop('scenario', None)
+        return result
+
+    def rpc_check(self, path, text=None, opt_level='0', passes=None):
+        result = self.build(path, text, opt_level, passes)
+        return {'diagnostics': result['diagnostics']}
+
+    def rpc_close(self, path):
+        self.buffers.pop(path, None)
+
+    def rpc_shutdown(self):
+        self.running = False
+
+    def build(self, path, text=None, opt_level='0', passes=None, width=None):
+        if width is None:
+            width = self.target.line_width
+        buffer = self.buffers.get(path)
+        if buffer is None:
+            buffer = self.buffers[path] = Buffer(path)
+        if text is not None:
+            buffer.text = text
+
+        try:
+            module, recompiled = self.compile_buffer(buffer, opt_level, passes)
+        except Exception as exc:
+            diagnostic = exception_diagnostic(exc, path)
+            if diagnostic is None:
+                raise
+            return {'diagnostics': [diagnostic]}
+
+        diagnostics = []
+        for check in [check_budget, check_tick_budget]:
+            try:
+                check(module, self.target)
+            except ValueError as exc:
+                diagnostic = exception_diagnostic(exc, path, 'warning')
+                if diagnostic is not None:
+                    diagnostics.append(diagnostic)
+        chars, lines = measure(module, self.target.line_width)
+        return {
+            'scenario': '\n'.join(pack_lines(iter_pieces(module), width)),
+            'size': {
+                'chars': chars,
+                'lines': lines,
+                'max_chars': self.target.max_chars,
+                'max_lines': self.target.max_lines,
+            },
+            'costs': buffer_costs(module, path),
+            'recompiled': recompiled,
+            'diagnostics': diagnostics,
+        }
+
+    def compile_buffer(self, buffer, opt_level, passes):
+        tree = ast.parse(buffer.text, buffer.path)
+        if not any(linker.find_imports(tree)):
+            module = compile_module(buffer.text, buffer.path, opt_level, passes, buffer.session,
+                                    target=self.target)
+            return module, buffer.session.converted
+
+        # Imported modules may change on disk, so scenarios with imports
+        # are linked again, from object files in the cache if there is one
+        builder = linker.Builder(linker.search_path(buffer.path), self.cache, self.target)
+        module = builder.build(buffer.text, buffer.path, opt_level, passes)
+        return module, [stmt.lineno for stmt in tree.body]
+
+
+def buffer_costs(module, path):
+    """Return characters added by lines of the buffer, but not by lines
+    of modules it imports.
+    """
+    return [{'line': lineno, 'chars': chars}
+            for (filename, lineno), chars in sorted(line_costs(module).items(), key=lambda item: item[0][1])
+            if filename == path]
+
+
+def exception_diagnostic(exc, path, severity='error'):
+    if isinstance(exc, SyntaxError):
+        lineno = exc.lineno
+    else:
+        lineno = getattr(exc, '_porcupy_lineno', None)
+    if lineno is None:
+        return
+    return {
+        'path': getattr(exc, '_porcupy_filename', path),
+        'line': lineno,
+        'severity': severity,
+        'message': '{}: {}'.format(type(exc).__name__, exc),
+    }
+
+
+def error_response(request_id, code, message, data=None):
+    error = {'code': code, 'message': message}
+    if data is not None:
+        error['data'] = data
+    return {'jsonrpc': '2.0', 'id': request_id, 'error': error}
+
+
+def read_message(reader):
+    """Read body of the next message, or return None at end of input."""
+    headers = {}
+    while True:
+        line = reader.readline()
+        if not line:
+            return
+        line = line.decode('ascii').strip()
+        if not line:
+            if headers:
+                break
+            continue
+        name, _, value = line.partition(':')
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers['content-length'])
+    except (KeyError, ValueError):
+        raise ValueError('expected Content-Length header') from None
+    return reader.read(length)
+
+
+def write_message(writer, message):
+    body = json.dumps(message).encode('utf-8')
+    writer.write('Content-Length: {}\r\n\r\n'.format(len(body)).encode('ascii'))
+    writer.write(body)
+    writer.flush()
@@ -0,0 +1,106 @@
+import attr
+
+from .ast import Module
+from .compiler import NodeConverter, visit_with_exc_wrapping
+from .target import DEFAULT_TARGET
+
+
+@attr.s
+class Session:
+    """Remember converted top-level statements between compilations.
+
+    A statement is converted again only if it or a statement before it
+    changed. Statements before the first change reuse their converted
+    nodes, and conversion resumes from the scope saved after the last
+    of them.
+
+    Nodes are shared between compilations, so a module compiled in the
+    session is only valid until the next compilation.
+    """
+
+    reused = attr.ib(default=0, init=False)
+    converted = attr.ib(default=attr.Factory(list), init=False)
+    _entries = attr.ib(default=attr.Factory(list), init=False)
+    _target = attr.ib(default=DEFAULT_TARGET, init=False)
+
+    def convert(self, source, tree, filename='<unknown>', cancelled=None, target=DEFAULT_TARGET):
+        # Statements converted for another target may not fit this one
+        if target != self._target:
+            del self._entries[:]
+            self._target = target
+
+        keys = statement_keys(source, tree)
+        reused = 0
+        for entry, key in zip(self._entries, keys):
+            if entry.key != key:
+                break
+            reused += 1
+        del self._entries[reused:]
+
+        converter = NodeConverter(cancelled=cancelled, target=target, filename=filename)
+        if self._entries:
+            self._entries[-1].checkpoint.restore(converter)
+        for entry in self._entries:
+            converter.body.extend(entry.body)
+        self.reused = reused
+        self.converted = []
+
+        changed_stmts = tree.body[reused:]
+        try:
+            for stmt in changed_stmts:
+                converter.check_imports(stmt)
+        except Exception as exc:
+            exc._porcupy_lineno = converter.current_stmt.lineno
+            raise
+        for stmt, key in zip(changed_stmts, keys[reused:]):
+            start = len(converter.body)
+            visit_with_exc_wrapping(converter, stmt, filename)
+            self._entries.append(Entry(key, converter.body[start:], Checkpoint.save(converter)))
+            self.converted.append(stmt.lineno)
+
+        # Allocating temporaries must not change the saved scope
+        return Module(converter.body), converter.scope.copy()
+
+
+@attr.s
+class Entry:
+    key = attr.ib()
+    body = attr.ib()
+    checkpoint = attr.ib()
+
+
+@attr.s
+class Checkpoint:
+    """State of the converter between two top-level statements."""
+
+    scope = attr.ib()
+    last_label = attr.ib()
+    temporary_types = attr.ib()
+
+    @classmethod
+    def save(cls, converter):
+        # Recycled temporaries change their types, and all temporaries
+        # get their indices when the module is finished
+        temporary_types = [slot.type for slot in converter.scope.temporary_slots]
+        return cls(converter.scope.copy(), converter.last_label, temporary_types)
+
+    def restore(self, converter):
+        converter.scope = self.scope.copy()
+        converter.last_label = self.last_label
+        for slot, type in zip(self.scope.temporary_slots, self.temporary_types):
+            slot.type = type
+            slot.index = None
+
+
+def statement_keys(source, tree):
+    """Return position and source lines of each top-level statement.
+
+    A statement spans lines up to the next statement, and at least its
+    own line. Positions are part of the key, because converted nodes
+    carry line numbers.
+    """
+    lines = source.splitlines()
+    starts = [stmt.lineno for stmt in tree.body]
+    ends = starts[1:] + [len(lines) + 1]
+    return [(stmt.lineno, stmt.col_offset, lines[start-1:max(end-1, start)])
+            for stmt, start, end in zip(tree.body, starts, ends)]
@@ -0,0 +1,101 @@
+import json
+
+import attr
+
+# Lowest and highest values of numeric fields of targets. Map files
+# store the length of each scenario line and the number of lines in a
+# byte.
+FIELD_LIMITS = {
+    'numeric_slots': (1, None),
+    'string_slots': (0, None),
+    'labels': (1, None),
+    'max_chars': (1, None),
+    'max_lines': (1, 255),
+    'line_width': (1, 255),
+    'loop_bound': (1, None),
+    'statement_cost': (0, None),
+    'condition_cost': (0, None),
+    'tick_budget': (1, None),
+}
+
+
+@attr.s(frozen=True)
+class Target:
+    """Resource limits of a Yozhiks build that scenarios run in.
+
+    Numeric variables are numbered from 1, string variables and jump
+    labels from 0 and 1 respectively. A scenario longer than *max_chars*
+    characters or *max_lines* lines is cut by the game.
+
+    Loops without a known bound are assumed to run *loop_bound* times
+    when estimating cost. Executing a statement costs *statement_cost*,
+    and testing the condition of a conditional statement costs
+    *condition_cost*. A scenario that may cost more than *tick_budget*
+    in a tick fails to build.
+    """
+
+    name = attr.ib()
+    numeric_slots = attr.ib(default=99)
+    string_slots = attr.ib(default=100)
+    labels = attr.ib(default=99)
+    max_chars = attr.ib(default=10000)
+    max_lines = attr.ib(default=100)
+    line_width = attr.ib(default=255)
+    loop_bound = attr.ib(default=100)
+    statement_cost = attr.ib(default=1)
+    condition_cost = attr.ib(default=1)
+    tick_budget = attr.ib(default=None)
+
+    @classmethod
+    def from_file(cls, path):
+        """Load target from a JSON object with the fields to change."""
+        with open(path) as fp:
+            fields = json.load(fp)
+        if not isinstance(fields, dict):
+            raise ValueError("target file '{}' must contain an object".format(path))
+        fields.setdefault('name', path)
+        try:
+            target = cls(**fields)
+        except TypeError as exc:
+            raise ValueError("target file '{}': {}".format(path, exc)) from None
+        for field in attr.fields(cls):
+            value = getattr(target, field.name)
+            # Fields that default to None may be left unset
+            if field.name in FIELD_LIMITS and not (value is None and field.default is None):
+                try:
+                    check_field(field.name, value)
+                except ValueError as exc:
+                    raise ValueError("target file '{}': {}".format(path, exc)) from None
+        return target
+
+
+def check_field(name, value):
+    """Raise ValueError if value of the target field is out of limits."""
+    low, high = FIELD_LIMITS[name]
+    if high is None:
+        expected = 'an integer of at least {}'.format(low)
+    else:
+        expected = 'an integer from {} to {}'.format(low, high)
+    if not isinstance(value, int) or isinstance(value, bool) or value < low or high is not None and value > high:
+        raise ValueError('{} must be {}, got {!r}'.format(name, expected, value))
+
+
+YOZHIKS = Target('yozhiks')
+
+TARGETS = {
+    YOZHIKS.name: YOZHIKS,
+}
+
+DEFAULT_TARGET = YOZHIKS
+
+
+def find_target(name):
+    """Return target of given name, or load it from a JSON file."""
+    try:
+        return TARGETS[name]
+    except KeyError:
+        pass
+    if name.endswith('.json'):
+        return Target.from_file(name)
+    raise ValueError("unknown target '{}', expected one of: {} or a JSON file"
+                     .format(name, ', '.join(sorted(TARGETS))))
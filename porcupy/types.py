@@ -1,6 +1,7 @@
 from abc import ABCMeta, abstractmethod
 import ast
 from collections import ChainMap
+from functools import lru_cache
 from inspect import signature
 import string
 import _string
@@ -11,8 +12,45 @@ import attr
 from .ast import Const, Slot, EvolvedSlot, BinOp, Add, Sub, Div, FloorDiv, Mod, Call
 
 
+class SharedType(type):
+    """Make instances of types with equal fields one and the same object.
+
+    Types are immutable, so equal types can be shared by all nodes and
+    compilations, and told apart by identity.
+    """
+
+    def __call__(cls, *args, **kwargs):
+        if not cls.shared:
+            return super().__call__(*args, **kwargs)
+        key = (cls, args)
+        if kwargs:
+            key += tuple(sorted(kwargs.items()))
+        try:
+            return _instances_by_args[key]
+        except KeyError:
+            instance = _instances_by_args[key] = share(super().__call__(*args, **kwargs))
+            return instance
+        except TypeError:
+            # Arguments are unhashable
+            return share(super().__call__(*args, **kwargs))
+
+
+def share(type_obj):
+    return _shared_instances.setdefault(type_obj, type_obj)
+
+
+_instances_by_args = {}
+_shared_instances = {}
+
+
 @attr.s(hash=True)
-class Type:
+class Type(metaclass=SharedType):
+    shared = True
+
+    def __reduce__(self):
+        # Unpickled types must be shared as well
+        return (_unpickle_type, (type(self), self.__dict__))
+
     def _getattr(self, converter, slot, attr_name):
         attrib = getattr(self, attr_name)
         if callable(attrib):
@@ -60,10 +98,10 @@ class NumberType(Type):
 
         if right.value < 0:
             if isinstance(op, Sub):
-                right.value = -right.value
+                right = attr.evolve(right, value=-right.value)
                 op = Add()
             elif isinstance(op, Add):
-                right.value = -right.value
+                right = attr.evolve(right, value=-right.value)
                 op = Sub()
         return op, right
 
@@ -379,6 +417,21 @@ class Reversed(Type):
         return sequence.type._getitem(converter, sequence, reversed_index)
 
 
+@attr.s(hash=True)
+class ModuleType(Type):
+    # Modules with the same name may export different names
+    shared = False
+
+    name = attr.ib()
+    exports = attr.ib(hash=False, cmp=False, repr=False)
+
+    def _getattr(self, converter, slot, attr_name):
+        try:
+            return self.exports[attr_name]
+        except KeyError:
+            raise AttributeError("module '{}' has no attribute '{}'".format(self.name, attr_name)) from None
+
+
 @attr.s(init=False, hash=True)
 class GameObjectList(Type):
     type = attr.ib()
@@ -414,13 +467,15 @@ class GameObject(IntType):
     def _getattr(self, converter, slot, attr_name):
         register = self.metadata['abbrev']
         attrib = getattr(self, attr_name)
+        metadata_stub = dict(**attrib.metadata)
         if callable(attrib):
-            attrib.metadata['type'] = GameObjectMethod(attrib)
+            # Methods are shared by all compilations, so their type is
+            # not stored in their metadata
+            metadata_stub['type'] = GameObjectMethod(attrib)
 
         if slot.is_variable():
             slot = EvolvedSlot(slot, register=register, ref=True)
 
-        metadata_stub = dict(**attrib.metadata)
         attrib_type = metadata_stub.pop('type')
         attrib_abbrev = metadata_stub.pop('abbrev')
         metadata = ChainMap(metadata_stub, slot.metadata)
@@ -431,9 +486,12 @@ class GameObject(IntType):
 
 @attr.s(hash=True)
 class CallableType(Type):
+    # Every callable type has its own call method
+    shared = False
+
     @classmethod
     def from_function(cls, func, instance=None):
-        sig = signature(func)
+        sig = cached_signature(func)
         if instance is None:
             def _call(self, converter, fn, *args):
                 check_func_args(converter, sig, args)
@@ -456,7 +514,7 @@ class GameObjectMethod(Type):
     signature = attr.ib(init=False)
 
     def __attrs_post_init__(self):
-        self.signature = signature(self.fn)
+        self.signature = cached_signature(self.fn)
 
     def _call(self, converter, func, *args):
         check_func_args(converter, self.signature, args)
@@ -468,18 +526,53 @@ class GameObjectMethod(Type):
             return result
 
 
+def cached_signature(func):
+    if isinstance(func, types.MethodType):
+        # Bound methods are created anew on every attribute access, so
+        # cache signature of underlying function and drop *self*
+        sig = function_signature(func.__func__)
+        return sig.replace(parameters=list(sig.parameters.values())[1:])
+    return function_signature(func)
+
+
+@lru_cache(maxsize=None)
+def function_signature(func):
+    return signature(func)
+
+
 def check_type(dest_slot, src_slot):
     dest_type_obj = dest_slot.type
-    dest_type = type(dest_type_obj)
     src_type_obj = src_slot.type
-    src_type = type(src_type_obj)
-
-    have_different_fields = (attr.fields(src_type) or attr.fields(dest_type)) and src_type_obj != dest_type_obj
-    if not are_types_related(src_type_obj, dest_type) or have_different_fields:
+    # Shared types are never freed, so their ids stay theirs
+    key = (id(src_type_obj), id(dest_type_obj))
+    compatible = _compatible_types.get(key)
+    if compatible is None:
+        compatible = are_types_compatible(src_type_obj, dest_type_obj)
+        if getattr(src_type_obj, 'shared', False) and getattr(dest_type_obj, 'shared', False):
+            _compatible_types[key] = compatible
+    if not compatible:
         raise TypeError("cannot assign value of type '{!r}' to variable of type '{!r}'"
                         .format(src_type_obj, dest_type_obj))
 
 
+def are_types_compatible(src_type_obj, dest_type_obj):
+    dest_type = type(dest_type_obj)
+    src_type = type(src_type_obj)
+    have_different_fields = (attr.fields(src_type) or attr.fields(dest_type)) and src_type_obj != dest_type_obj
+    return are_types_related(src_type_obj, dest_type) and not have_different_fields
+
+
+_compatible_types = {}
+
+
+def _unpickle_type(cls, state):
+    type_obj = object.__new__(cls)
+    type_obj.__dict__.update(state)
+    if cls.shared:
+        return share(type_obj)
+    return type_obj
+
+
 def check_func_args(converter, signature, args):
     bound = signature.bind(converter, *args)
     for name, value in list(bound.arguments.items())[1:]:
@@ -0,0 +1,7 @@
+import sys
+
+collect_ignore = []
+
+# Coroutines with async and await need Python 3.5
+if sys.version_info < (3, 5):
+    collect_ignore.append('test_aio.py')
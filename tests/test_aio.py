@@ -0,0 +1,93 @@
+import ast
+import asyncio
+import time
+
+import pytest
+
+from porcupy import aio
+from porcupy.aio import AsyncCompiler, compile_async, compile_stream
+from porcupy.ast import Assign, Compare, Const, If, Module, Slot
+from porcupy.compiler import compile as compile_
+from porcupy.types import IntType
+
+SOURCE = ('x = [11, 22, 33]\n'
+          'y = 0\n'
+          'for i in range(3):\n'
+          '    y += x[i]')
+LONG_SOURCE = 'x = 1\n' + 'x = x + 1\n' * 10000
+
+
+def run(coro):
+    return asyncio.get_event_loop().run_until_complete(coro)
+
+
+def test_compile_async():
+    assert run(compile_async(SOURCE, opt_level='s')) == compile_(SOURCE, opt_level='s')
+
+    with pytest.raises(NameError) as exc_info:
+        run(compile_async('x = y'))
+    assert exc_info.value._porcupy_lineno == 1
+
+
+async def collect(stream):
+    pieces = []
+    async for piece in stream:
+        pieces.append(piece)
+    return pieces
+
+
+def test_stream(monkeypatch):
+    pieces = run(collect(compile_stream(SOURCE, opt_level=2)))
+    assert ' '.join(pieces) == compile_(SOURCE, opt_level=2)
+
+    with pytest.raises(NameError):
+        run(collect(compile_stream('x = 1\ny = z')))
+
+    # Statements in bodies of conditional statements are separate pieces
+    x = Slot('p', 1, 'z', IntType())
+    module = Module([If(Compare(x, ast.Gt(), Const(0)), [Assign(x, Const(1)), Assign(x, Const(2))])])
+    monkeypatch.setattr(aio, 'compile_module', lambda *args, **kwargs: module)
+    assert run(collect(compile_stream('x = 1'))) == ['# p1z > 0 ( p1z 1', 'p1z 2 )']
+
+
+def test_timeout():
+    compiler = AsyncCompiler(limit=1)
+    try:
+        with pytest.raises(asyncio.TimeoutError):
+            run(compiler.compile(LONG_SOURCE, timeout=0.01))
+
+        # Worker stops soon after timeout, so that the next compilation
+        # does not wait for the long one
+        start = time.perf_counter()
+        assert run(compiler.compile('x = 1', timeout=1)) == 'p1z 1'
+        assert time.perf_counter() - start < 0.5
+
+        async def cancel_stream():
+            stream = compiler.stream(LONG_SOURCE)
+            task = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return await compiler.compile('x = 2', timeout=1)
+
+        start = time.perf_counter()
+        assert run(cancel_stream()) == 'p1z 2'
+        assert time.perf_counter() - start < 0.5
+
+        async def close_stream():
+            stream = compiler.stream(LONG_SOURCE)
+            task = asyncio.ensure_future(stream.__anext__())
+            await asyncio.sleep(0.01)
+            await stream.aclose()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            with pytest.raises(StopAsyncIteration):
+                await stream.__anext__()
+            return await compiler.compile('x = 3', timeout=1)
+
+        start = time.perf_counter()
+        assert run(close_stream()) == 'p1z 3'
+        assert time.perf_counter() - start < 0.5
+    finally:
+        compiler.shutdown()
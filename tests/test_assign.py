@@ -1,6 +1,8 @@
+import ast
+
 import pytest
 
-from porcupy.compiler import compile as compile_
+from porcupy.compiler import NodeConverter, compile as compile_
 
 
 def test_consts():
@@ -17,6 +19,13 @@ def test_consts():
         assert compile_('X = 4.5') == ''
     assert 'cannot define a constant' in str(exc_info.value)
 
+    # Negative constant keeps its sign after being subtracted
+    assert compile_('X = -1; y = 5; z = y - X; z = y - X') == 'p1z 5 p2z p1z+1 p2z p1z+1'
+
+    # Names defined in one module do not leak into another
+    assert compile_('X = 4') == ''
+    assert compile_('X = 5') == ''
+
 
 def test_numbers():
     assert compile_('x = 4') == 'p1z 4'
@@ -64,6 +73,21 @@ def test_binary_op():
     assert compile_('x = 4; Y = -1; z = x-Y') == 'p1z 4 p2z p1z+1'
 
 
+@pytest.mark.parametrize('length', [10000, 100000])
+def test_long_binary_op(length):
+    # Chains of operations nest as deep as they are long
+    assert compile_('x = ' + ' + '.join(['1'] * length)) == 'p1z {}'.format(length)
+    assert compile_('x = 5; y = x - (' + ' + '.join(['1'] * length) + ')') == 'p1z 5 p2z p1z-{}'.format(length)
+
+    # Parser does not nest parentheses that deep, so build the tree
+    tree = ast.parse('x = 1; y = 0')
+    value = ast.Num(1)
+    for _ in range(length - 1):
+        value = ast.BinOp(ast.Num(1), ast.Add(), value)
+    tree.body[1].value = ast.BinOp(ast.Name('x', ast.Load()), ast.Add(), value)
+    assert str(NodeConverter().visit(tree)) == 'p1z 1  p2z p1z+{}'.format(length)
+
+
 def test_compare():
     # assert compile_('x = 3 < 5') == 'p1z 1'
     # assert compile_('x = 3 < 5 < 6') == 'p1z 1'
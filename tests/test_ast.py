@@ -0,0 +1,57 @@
+import pickle
+
+import pytest
+
+from porcupy.ast import EMPTY_METADATA, Const, BinOp, Add, Slot, EvolvedSlot
+from porcupy.gameobjs import Yozhik
+from porcupy.types import CallableType, GameObjectList, IntType, ListPointer, ModuleType, NumberType, check_type
+
+
+def test_compact_nodes():
+    left = Const(1)
+    right = Slot('p', 1, 'z', IntType())
+    node = BinOp(left, Add(), right)
+    assert not hasattr(node, '__dict__')
+    assert left.metadata is right.metadata is node.metadata is EMPTY_METADATA
+    assert node.type is left.type is NumberType()
+    assert right.type is IntType()
+    assert CallableType() is not CallableType()
+
+    loaded = pickle.loads(pickle.dumps(node))
+    assert str(loaded) == str(node)
+    assert loaded.metadata is EMPTY_METADATA
+    assert loaded.type is NumberType()
+
+
+def test_evolved_slot():
+    temp = Slot('p', None, 'z', IntType())
+    ref = EvolvedSlot(EvolvedSlot(temp, register='e', ref=True), attrib='x')
+    assert ref._original is temp
+    assert ref.register == 'e'
+    assert ref.type is IntType()
+    assert ref.is_variable()
+    with pytest.raises(AttributeError):
+        ref.type = NumberType()
+
+    # Temporaries get their indices later
+    assert str(ref) == 'e^x'
+    temp.index = 3
+    assert ref.index == 3
+    assert str(ref) == 'e^3x'
+
+    loaded = pickle.loads(pickle.dumps(ref))
+    assert loaded == ref
+    assert str(loaded) == 'e^3x'
+
+
+def test_shared_types():
+    pointer = ListPointer(IntType(), 3)
+    assert pointer is ListPointer(IntType(), 3)
+    assert pointer is not ListPointer(IntType(), 4)
+    assert pickle.loads(pickle.dumps(pointer)) is pointer
+    assert GameObjectList(Yozhik(), 1, 10) is GameObjectList(Yozhik(), 1, 10)
+    assert ModuleType('a', {'x': Const(1)}) is not ModuleType('a', {'y': Const(2)})
+
+    check_type(Slot('p', 1, 'z', pointer), Slot('p', 2, 'z', pointer))
+    with pytest.raises(TypeError):
+        check_type(Slot('p', 1, 'z', pointer), Slot('p', 2, 'z', ListPointer(IntType(), 4)))
@@ -0,0 +1,48 @@
+import os
+
+from porcupy.cache import CompilationCache
+from porcupy.compiler import compile as compile_
+
+
+def test_hits_and_misses(tmpdir):
+    cache = CompilationCache(str(tmpdir))
+    assert compile_('x = 1; y = x', cache=cache) == 'p1z 1 p2z p1z'
+    assert (cache.hits, cache.misses) == (0, 1)
+    assert compile_('x = 1; y = x', cache=cache) == 'p1z 1 p2z p1z'
+    assert compile_('x = 1; y = x', separate_stmts=True, cache=cache) == 'p1z 1  p2z p1z'
+    assert (cache.hits, cache.misses) == (2, 1)
+
+    # Options are part of the key
+    compile_('x = 1; y = x', opt_level='s', cache=cache)
+    assert (cache.hits, cache.misses) == (2, 2)
+
+    cache.clear()
+    compile_('x = 1; y = x', cache=cache)
+    assert (cache.hits, cache.misses) == (2, 3)
+
+
+def test_metadata(tmpdir):
+    cache = CompilationCache(str(tmpdir))
+    source = 'x = 0\nwhile x < 5:\n    x += 1'
+    compile_(source, cache=cache)
+    entry = cache.get(cache.key(source, opt_level='0', passes=None))
+    assert entry == {
+        'scenario': 'p1z 0  :1  # p1z >= 5 ( g2z )  p1z p1z+1  g1z  :2',
+        'slots': [1],
+        'labels': 2,
+        'size': 44,
+    }
+
+
+def test_eviction(tmpdir):
+    cache = CompilationCache(str(tmpdir), max_size=150)
+    for i in range(5):
+        compile_('x = {}'.format(i), cache=cache)
+        path = os.path.join(str(tmpdir), cache.key('x = {}'.format(i), opt_level='0', passes=None) + '.json')
+        os.utime(path, (i, i))
+    assert len(tmpdir.listdir()) == 2
+
+    # Least recently used entries are gone
+    assert compile_('x = 4', cache=cache) == 'p1z 4'
+    assert compile_('x = 0', cache=cache) == 'p1z 0'
+    assert (cache.hits, cache.misses) == (1, 6)
@@ -0,0 +1,178 @@
+import io
+import os
+import stat
+import sys
+
+import pytest
+
+from porcupy import cli
+from porcupy.cli import BatchJob, Map, ScenarioAttacher, batch, codewrap, find_batch_jobs, main, poll_changes
+
+
+def test_codewrap():
+    assert codewrap('', 10) == ''
+    assert codewrap('p1z 1  p2z 2  p3z 3', None) == 'p1z 1 p2z 2 p3z 3'
+    assert codewrap('p1z 1  p2z 2  p3z 3', 11) == 'p1z 1 p2z 2\np3z 3'
+    assert codewrap('p1z 1  p2z 2  p3z 3', 10) == 'p1z 1\np2z 2\np3z 3'
+
+    # Bodies of conditional statements can be split between lines
+    assert codewrap('# p1z > 0 ( p1z 1  p2z 2 )', 15) == '# p1z > 0 ( p1z 1\np2z 2 )'
+
+
+def test_codewrap_long_stmts():
+    assert codewrap('ym Hello_World  p1z 1  p2z 2', 5) == 'ym Hello_World\np1z 1\np2z 2'
+    assert codewrap('p1z 1  ym Hello_World  p2z 2', 5) == 'p1z 1\nym Hello_World\np2z 2'
+
+
+EMPTY_MAP = b'header_' + b'\x00' + b'rest'
+
+
+def read_scenario(path):
+    with path.open('rb') as fp:
+        return Map.from_file(fp).scenario
+
+
+def test_attach(tmpdir):
+    path = tmpdir.join('map.egm')
+    path.write_binary(b'header_' + b'\x01' + b'\x03old' + b'rest')
+    path.chmod(0o644)
+
+    writer = ScenarioAttacher(str(path))
+    writer.write('p1z 1 p2z')
+    writer.write(' 2\np3z 3\n')
+    writer.write('ym \u041f\u0440\u0438\u0432\u0435\u0442')
+    # Map is replaced on close
+    assert read_scenario(path) == 'old\n'
+    writer.close()
+    assert path.read_binary() == (b'header_' + b'\x03' + b'\x0bp1z 1 p2z 2' + b'\x05p3z 3' +
+                                  b'\x09ym \xcf\xf0\xe8\xe2\xe5\xf2' + b'rest')
+    assert stat.S_IMODE(os.stat(str(path)).st_mode) == 0o644
+    assert tmpdir.listdir() == [path]
+
+    writer = ScenarioAttacher(str(path))
+    writer.write('p1z 1\n' * 300)
+    with pytest.warns(UserWarning) as record:
+        writer.close()
+    assert [str(warning.message) for warning in record] == [
+        "scenario is over 255 lines, extra lines won't be saved",
+    ]
+    assert read_scenario(path) == 'p1z 1\n' * 255
+
+    writer = ScenarioAttacher(str(path))
+    writer.write('p1z 2\n')
+    writer.discard()
+    assert read_scenario(path) == 'p1z 1\n' * 255
+    assert tmpdir.listdir() == [path]
+
+
+def run_main(monkeypatch, *args):
+    monkeypatch.setattr(sys, 'argv', ['porcupy'] + list(args))
+    with pytest.raises(SystemExit) as exc_info:
+        main()
+    return exc_info.value.code
+
+
+def test_main_attach(tmpdir, monkeypatch):
+    path = tmpdir.join('map.egm')
+    path.write_binary(EMPTY_MAP)
+    source = tmpdir.join('map.py')
+    source.write('x = 1')
+    assert run_main(monkeypatch, '-i', str(source), '-a', str(path)) is None
+    assert read_scenario(path) == 'p1z 1\n'
+
+    # Map stays as it was when compilation fails
+    source.write('x = y')
+    assert run_main(monkeypatch, '-i', str(source), '-a', str(path)) == 1
+
+    def crash(*args, **kwargs):
+        raise RuntimeError('crash')
+
+    monkeypatch.setattr(cli, 'scenario_lines', crash)
+    with pytest.raises(RuntimeError):
+        run_main(monkeypatch, '-i', str(source), '-a', str(path))
+    assert read_scenario(path) == 'p1z 1\n'
+    assert sorted(tmpdir.listdir()) == [path, source]
+
+
+def test_batch(tmpdir):
+    tmpdir.join('good.py').write('x = 1')
+    tmpdir.join('good.egm').write_binary(EMPTY_MAP)
+    tmpdir.join('bad.py').write('x = y')
+    tmpdir.join('bad.egm').write_binary(EMPTY_MAP)
+    tmpdir.join('orphan.py').write('x = 1')
+
+    output = io.StringIO()
+    assert batch(str(tmpdir), jobs=1, file=output) == 1
+    lines = output.getvalue().splitlines()
+    assert lines[0] == 'FAILED  {}'.format(tmpdir.join('bad.py'))
+    assert "    NameError: name 'y' is not defined" in lines
+    assert lines[-2] == 'ok      {} -> {}'.format(tmpdir.join('good.py'), tmpdir.join('good.egm'))
+    assert lines[-1] == '1 compiled, 1 failed'
+
+    assert read_scenario(tmpdir.join('good.egm')) == 'p1z 1\n'
+    assert tmpdir.join('bad.egm').read_binary() == EMPTY_MAP
+
+
+def test_batch_manifest(tmpdir):
+    tmpdir.mkdir('src').join('a.py').write('x = 1')
+    tmpdir.join('src', 'b.py').write('x = 2')
+    tmpdir.mkdir('maps').join('a.egm').write_binary(EMPTY_MAP)
+    tmpdir.join('maps', 'b.egm').write_binary(EMPTY_MAP)
+    manifest = tmpdir.join('maps.txt')
+    manifest.write('# source map\n'
+                   'src/a.py maps/a.egm\n'
+                   '\n'
+                   'src/b.py maps/b.egm  # second map\n')
+
+    output = io.StringIO()
+    assert batch(str(manifest), jobs=2, file=output) == 0
+    assert output.getvalue().splitlines()[-1] == '2 compiled, 0 failed'
+    assert read_scenario(tmpdir.join('maps', 'a.egm')) == 'p1z 1\n'
+    assert read_scenario(tmpdir.join('maps', 'b.egm')) == 'p1z 2\n'
+
+    manifest.write('src/a.py\n')
+    with pytest.raises(ValueError) as exc_info:
+        find_batch_jobs(str(manifest))
+    assert 'maps.txt:1: expected source and map paths' in str(exc_info.value)
+
+
+def test_batch_errors(tmpdir, monkeypatch, capsys):
+    assert run_main(monkeypatch, '--batch', str(tmpdir.join('missing.txt'))) == 2
+    assert 'argument --batch: [Errno 2] No such file or directory' in capsys.readouterr()[1]
+
+    manifest = tmpdir.join('maps.txt')
+    manifest.write('src/a.py\n')
+    assert run_main(monkeypatch, '--batch', str(manifest)) == 2
+    assert 'maps.txt:1: expected source and map paths' in capsys.readouterr()[1]
+
+    assert run_main(monkeypatch, '--batch', str(tmpdir), '-j', '0') == 2
+    assert 'argument -j/--jobs: must be at least 1' in capsys.readouterr()[1]
+
+
+def test_tick_budget(monkeypatch, capsys):
+    assert run_main(monkeypatch, '--tick-budget', '0') == 2
+    assert 'argument --tick-budget: tick_budget must be an integer of at least 1, got 0' in capsys.readouterr()[1]
+
+
+def test_poll_changes(tmpdir):
+    a = BatchJob(str(tmpdir.join('a.py')), str(tmpdir.join('a.egm')))
+    b = BatchJob(str(tmpdir.join('b.py')), str(tmpdir.join('b.egm')))
+    missing = BatchJob(str(tmpdir.join('c.py')), str(tmpdir.join('c.egm')))
+    tmpdir.join('a.py').write('x = 1')
+    tmpdir.join('b.py').write('x = 2')
+
+    stamps = {}
+    assert poll_changes([a, b, missing], stamps) == [a, b]
+    assert poll_changes([a, b, missing], stamps) == []
+
+    tmpdir.join('b.py').write('x = 3')
+    os.utime(b.source, ns=(0, 0))
+    assert poll_changes([a, b, missing], stamps) == [b]
+
+    # Jobs are attached again when modules they import change
+    tmpdir.join('lib.py').write('X = 1')
+    dependencies = {a.source: [str(tmpdir.join('lib.py'))]}
+    assert poll_changes([a, b], stamps, dependencies) == [a]
+    assert poll_changes([a, b], stamps, dependencies) == []
+    tmpdir.join('lib.py').write('X = 12')
+    assert poll_changes([a, b], stamps, dependencies) == [a]
@@ -0,0 +1,52 @@
+import pytest
+
+from porcupy.compiler import compile_module
+from porcupy.cost import check_tick_budget, estimate_cost
+from porcupy.target import Target
+
+
+SOURCE = '''\
+x = 0
+for i in range(5):
+    for yozhik in yozhiks:
+        x += 1
+while x < 100:  # bound: 7
+    if x > 3:
+        x += 2
+while x:
+    x -= 1
+'''
+
+
+@pytest.mark.parametrize('opt_level', ['0', '2'])
+def test_estimate_cost(opt_level):
+    module = compile_module(SOURCE, 'test.py', opt_level)
+    report = estimate_cost(module, Target('test', loop_bound=50))
+    loops = [(loop.filename, loop.lineno, loop.bound, loop.bounded) for loop in report.loops]
+    assert loops == [('test.py', 2, 5, True), ('test.py', 3, 9, True), ('test.py', 5, 7, True),
+                     ('test.py', 8, 50, False)]
+
+    # Inner loop runs for each iteration of the outer one
+    assert report.lines['test.py', 4] == 5 * 9
+    assert report.lines['test.py', 9] == 50
+    assert report.worst == sum(report.lines.values())
+    assert report.typical < report.worst
+
+
+def test_tick_budget():
+    module = compile_module(SOURCE, 'test.py')
+    worst = estimate_cost(module).worst
+    check_tick_budget(module, Target('test', tick_budget=worst))
+    with pytest.raises(ValueError) as exc_info:
+        check_tick_budget(module, Target('test', tick_budget=worst - 1))
+    assert exc_info.value._porcupy_lineno == 8
+    assert exc_info.value._porcupy_filename == 'test.py'
+
+
+def test_target_costs():
+    module = compile_module(SOURCE, 'test.py')
+    report = estimate_cost(module)
+    costly = estimate_cost(module, Target('test', statement_cost=2, condition_cost=3))
+    assert costly.lines['test.py', 4] == 2 * report.lines['test.py', 4]
+    assert costly.conditions == report.conditions
+    assert costly.worst > 2 * report.worst
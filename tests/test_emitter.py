@@ -0,0 +1,49 @@
+import io
+
+from porcupy.compiler import compile_module
+from porcupy.emitter import emit, measure, source_map
+
+
+def test_emit():
+    module = compile_module('x = 3; y = 0\n'
+                            'if x > 1:\n'
+                            '    y = x\n'
+                            '    x = 1\n'
+                            'print("{}".format(y))')
+
+    writer = io.StringIO()
+    assert emit(module, writer, 20) == (54, 4)
+    assert writer.getvalue() == 'p1z 3 p2z 0\n# p1z <= 1 ( g1z )\np2z p1z p1z 1 :1\nym ^2\n'
+    assert measure(module, 20) == (53, 4)
+
+    writer = io.StringIO()
+    assert emit(module, writer) == (54, 1)
+    assert writer.getvalue() == 'p1z 3 p2z 0 # p1z <= 1 ( g1z ) p2z p1z p1z 1 :1 ym ^2\n'
+
+    writer = io.BytesIO()
+    emit(compile_module('print("Привет")'), writer, 20, 'cp1251')
+    assert writer.getvalue() == b'ym \xcf\xf0\xe8\xe2\xe5\xf2\n'
+
+
+def test_source_map():
+    module = compile_module('x = 3; y = 0\n'
+                            'if x > 1:\n'
+                            '    y = x\n'
+                            'print("{}".format(y))', 'test.py')
+
+    # p1z 3 p2z 0
+    # # p1z <= 1 ( g1z )
+    # p2z p1z :1 ym ^2
+    assert source_map(module, 20, 'test.txt') == {
+        'version': 1,
+        'file': 'test.txt',
+        'sources': ['test.py'],
+        'mappings': [
+            [1, 0, 5, 0, 1],
+            [1, 6, 5, 0, 1],
+            [2, 0, 18, 0, 2],
+            [3, 0, 7, 0, 3],
+            [3, 8, 2, 0, 2],
+            [3, 11, 5, 0, 4],
+        ],
+    }
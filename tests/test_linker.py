@@ -0,0 +1,159 @@
+import pytest
+
+from porcupy.cache import CompilationCache
+from porcupy.cli import check_budget, line_costs
+from porcupy.compiler import compile as compile_, compile_module
+from porcupy.linker import Builder
+from porcupy.target import Target
+
+
+def build(tmpdir, source, **kwargs):
+    builder = Builder([str(tmpdir)], **kwargs)
+    return str(builder.build(source, opt_level=kwargs.pop('opt_level', 0))), builder
+
+
+def test_single_module():
+    source = ('x = [11, 22, 33]\n'
+              'y = 0\n'
+              'for i in range(3):\n'
+              '    y += x[i]\n'
+              'print("{}".format(y))')
+    for opt_level in ['0', '2', 's']:
+        assert str(Builder().build(source, opt_level=opt_level)) == str(compile_module(source, opt_level=opt_level))
+
+
+def test_imports(tmpdir):
+    tmpdir.join('lib.py').write('LIMIT = 3\n'
+                                'XS = [10, 20, 30]\n'
+                                'counter = 0\n'
+                                'counter += 1\n')
+    output, builder = build(tmpdir, 'from lib import LIMIT, XS\n'
+                                    'import lib\n'
+                                    'x = XS[1] + LIMIT\n'
+                                    'lib.counter += 5\n'
+                                    'y = XS[x]')
+    # Slots of the module follow slots of lib, and list pointer is
+    # relocated with them
+    assert output == ('p1z 10  p2z 20  p3z 30  p4z 0  p4z p4z+1  '
+                      'p5z p2z+3  p4z p4z+5  p7z p5z+1  p8z p^7z  p6z p8z')
+    assert builder.compiled == ['lib', '__main__']
+
+    tmpdir.join('a.py').write('import lib\n'
+                              'a = lib.counter')
+    tmpdir.join('b.py').write('import lib\n'
+                              'b = lib.counter')
+    output, builder = build(tmpdir, 'import a, b as c\n'
+                                    'x = a.a + c.b')
+    # Module imported twice is linked once
+    assert output == 'p1z 10  p2z 20  p3z 30  p4z 0  p4z p4z+1  p5z p4z  p6z p4z  p7z p5z+p6z'
+    assert builder.compiled == ['lib', 'a', 'b', '__main__']
+
+
+def test_labels(tmpdir):
+    tmpdir.join('lib.py').write('x = 0\n'
+                                'while x < 5:\n'
+                                '    x += 1')
+    output, _ = build(tmpdir, 'import lib\n'
+                              'if lib.x > 2:\n'
+                              '    y = 1')
+    assert output == 'p1z 0  :1  # p1z >= 5 ( g2z )  p1z p1z+1  g1z  :2  # p1z <= 2 ( g3z )  p2z 1  :3'
+
+
+def test_shared_temporaries(tmpdir):
+    tmpdir.join('lib.py').write('x = 1\n'
+                                'y = 2\n'
+                                'z = 3\n'
+                                'x, y, z = y, z, x')
+    source = ('import lib\n'
+              'a = 1\n'
+              'b = 2\n'
+              'a, b = b, a')
+    # Modules run one after another, so they use the same temporaries
+    output, _ = build(tmpdir, source, target=Target('test', numeric_slots=8))
+    assert output == ('p1z 1  p2z 2  p3z 3  p6z p2z  p7z p3z  p8z p1z  p1z p6z  p2z p7z  p3z p8z  '
+                      'p4z 1  p5z 2  p6z p5z  p7z p4z  p4z p6z  p5z p7z')
+
+    with pytest.raises(MemoryError) as exc_info:
+        build(tmpdir, source, target=Target('test', numeric_slots=7))
+    assert 'ran out of variable slots' in str(exc_info.value)
+
+
+def test_import_errors(tmpdir):
+    tmpdir.join('lib.py').write('X = 1')
+    tmpdir.join('broken.py').write('x = 1\n'
+                                   'y = z')
+    tmpdir.join('cycle1.py').write('import cycle2')
+    tmpdir.join('cycle2.py').write('import cycle1')
+
+    with pytest.raises(ImportError) as exc_info:
+        build(tmpdir, 'import missing')
+    assert "no module named 'missing'" in str(exc_info.value)
+    assert exc_info.value._porcupy_lineno == 1
+
+    with pytest.raises(ImportError) as exc_info:
+        build(tmpdir, 'from lib import Y')
+    assert "cannot import name 'Y' from 'lib'" in str(exc_info.value)
+
+    with pytest.raises(NameError) as exc_info:
+        build(tmpdir, 'x = 1\nimport broken')
+    assert exc_info.value._porcupy_lineno == 2
+    assert exc_info.value._porcupy_filename == str(tmpdir.join('broken.py'))
+
+    with pytest.raises(ImportError) as exc_info:
+        build(tmpdir, 'import cycle1')
+    assert 'circular import: cycle1 -> cycle2 -> cycle1' in str(exc_info.value)
+
+    with pytest.raises(NotImplementedError) as exc_info:
+        build(tmpdir, 'if 1:\n    import lib')
+    assert 'imports are only supported at module level' in str(exc_info.value)
+
+    with pytest.raises(NotImplementedError) as exc_info:
+        build(tmpdir, 'from lib import *')
+    assert "'from lib import *' is not supported" in str(exc_info.value)
+
+    with pytest.raises(ImportError) as exc_info:
+        compile_('import lib')
+    assert "cannot import 'lib'" in str(exc_info.value)
+
+
+def test_incremental(tmpdir):
+    src = tmpdir.mkdir('src')
+    src.join('lib.py').write('x = 1')
+    src.join('util.py').write('y = 2')
+    src.join('app.py').write('import lib\n'
+                             'z = lib.x')
+    source = 'import app, util'
+    cache = CompilationCache(str(tmpdir.join('cache')))
+
+    first, builder = build(src, source, cache=cache)
+    assert builder.compiled == ['lib', 'app', 'util', '__main__']
+
+    output, builder = build(src, source, cache=cache)
+    assert output == first
+    assert builder.compiled == []
+
+    # Modules importing changed module are compiled again
+    src.join('lib.py').write('x = 3')
+    output, builder = build(src, source, cache=cache)
+    assert output == 'p1z 3  p2z p1z  p3z 2'
+    assert builder.compiled == ['lib', 'app', '__main__']
+
+
+def test_budget(tmpdir):
+    tmpdir.join('lib.py').write('x = 1\n'
+                                'y = 123456789\n'
+                                'z = 123456789')
+    main = str(tmpdir.join('main.py'))
+    target = Target('test', max_chars=40)
+    module = Builder([str(tmpdir)], target=target).build('import lib\n'
+                                                         'a = 2\n'
+                                                         'b = 3', main)
+    # Lines of different modules are counted apart
+    lib = str(tmpdir.join('lib.py'))
+    assert line_costs(module) == {(lib, 1): 6, (lib, 2): 14, (lib, 3): 14, (main, 2): 6, (main, 3): 6}
+
+    with pytest.raises(ValueError) as exc_info:
+        check_budget(module, target)
+    assert '  {}:2: 14'.format(lib) in str(exc_info.value)
+    assert exc_info.value._porcupy_filename == lib
+    assert exc_info.value._porcupy_lineno == 2
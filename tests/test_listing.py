@@ -0,0 +1,36 @@
+from porcupy.compiler import compile_module
+from porcupy.listing import format_listing, list_statements
+
+
+SOURCE = '''\
+x = 3; y = 0
+if x > 1:
+    y = x
+print("{}".format(y))
+'''
+
+
+def test_list_statements():
+    module = compile_module(SOURCE, 'test.py')
+    lines = list_statements(module, 20)['test.py']
+    assert sorted(lines) == [1, 2, 3, 4]
+    assert [(str(listed.stmt), listed.chars, listed.slots, listed.line) for listed in lines[2]] == [
+        ('# p1z <= 1 ( g1z )', 18, ['p1'], 2),
+        (':1', 2, [], 3),
+    ]
+    assert [(listed.slots, listed.line) for listed in lines[3]] == [(['p1', 'p2'], 3)]
+
+
+def test_format_listing():
+    module = compile_module(SOURCE, 'test.py')
+    listing = format_listing(module, 20, {'test.py': SOURCE}).splitlines()
+    assert listing[0] == '; test.py'
+    assert listing[2:5] == [
+        '   1  x = 3; y = 0',
+        '         1      5  p1           p1z 3',
+        '         1      5  p2           p2z 0',
+    ]
+    assert listing[-2:] == [
+        '   4  print("{}".format(y))',
+        '         3      5  p2           ym ^2',
+    ]
@@ -0,0 +1,27 @@
+import tracemalloc
+
+from porcupy.compiler import compile as compile_
+from porcupy.metrics import Metrics
+
+
+def test_metrics():
+    metrics = Metrics()
+    source = ('x = 1\n'
+              'y = x * 2 + x * 3\n'
+              'z = x * 4 + x * 5\n'
+              'if y > z:\n'
+              '    y = 0\n')
+    tracemalloc.start()
+    try:
+        scenario = compile_(source, metrics=metrics)
+    finally:
+        tracemalloc.stop()
+
+    assert list(metrics.times) == ['parse', 'convert', 'allocate', 'optimize', 'emit']
+    assert metrics.converted_stmts == metrics.emitted_stmts == 10
+    assert metrics.slots == 3 + metrics.temporaries
+    assert metrics.labels == 1
+    assert metrics.temporaries == 2
+    assert metrics.reused_temporaries == 2
+    assert (metrics.chars, metrics.lines) == (len(scenario), 1)
+    assert metrics.memory_peak > 0
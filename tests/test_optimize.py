@@ -0,0 +1,122 @@
+import pytest
+
+from porcupy.cli import check_budget
+from porcupy.compiler import compile as compile_, compile_module
+
+
+def test_levels():
+    source = ('x = 1\n'
+              'while x < 5:\n'
+              '    if x > 2:\n'
+              '        continue\n'
+              '    x += 1')
+    assert compile_(source, opt_level=0) == 'p1z 1 :1 # p1z >= 5 ( g2z ) # p1z <= 2 ( g3z ) g1z :3 p1z p1z+1 g1z :2'
+    assert compile_(source, opt_level=1) == 'p1z 1 :1 # p1z >= 5 ( g2z ) # p1z <= 2 ( g3z ) g1z :3 p1z p1z+1 g1z :2'
+    assert compile_(source, opt_level=2) == 'p1z 1 :1 # p1z >= 5 ( g2z ) # p1z > 2 ( g1z ) p1z p1z+1 g1z :2'
+    assert compile_(source, opt_level=3) == 'p1z 1 :1 # p1z >= 5 ( g2z ) # p1z > 2 ( g1z ) p1z p1z+1 g1z :2'
+    assert compile_(source, opt_level='s') == 'p1z 1 :1 # p1z >= 5 ( g2z ) # p1z > 2 ( g1z ) p1z p1z+1 g1z :2'
+
+    with pytest.raises(ValueError) as exc_info:
+        compile_(source, opt_level=4)
+    assert "unknown optimization level '4'" in str(exc_info.value)
+
+    with pytest.raises(ValueError) as exc_info:
+        compile_(source, passes=['unroll-loops'])
+    assert "unknown optimization pass 'unroll-loops'" in str(exc_info.value)
+
+
+def test_dead_code():
+    assert (compile_('x = 1\n'
+                     'while x < 5:\n'
+                     '    x += 1\n'
+                     '    break\n'
+                     '    x = 2', passes=['remove-dead-code']) ==
+            'p1z 1 # p1z >= 5 ( g2z ) p1z p1z+1 :2')
+    assert (compile_('x = 1\n'
+                     'while x < 5:\n'
+                     '    x += 1', passes=['remove-dead-code']) ==
+            'p1z 1 :1 # p1z >= 5 ( g2z ) p1z p1z+1 g1z :2')
+
+
+def test_thread_jumps():
+    assert (compile_('x = 1\n'
+                     'while x < 5:\n'
+                     '    if x > 2:\n'
+                     '        x = 2\n'
+                     '    else:\n'
+                     '        break', passes=['thread-jumps']) ==
+            'p1z 1 :1 # p1z >= 5 ( g2z ) # p1z <= 2 ( g2z ) p1z 2 g1z :4 g2z :3 g1z :2')
+
+
+def test_invert_branches():
+    assert (compile_('x = 1\n'
+                     'while x < 5:\n'
+                     '    if x > 2:\n'
+                     '        continue\n'
+                     '    x += 1', passes=['invert-branches']) ==
+            'p1z 1 :1 # p1z >= 5 ( g2z ) # p1z > 2 ( g1z ) :3 p1z p1z+1 g1z :2')
+
+
+def test_identity_ops():
+    passes = ['fold-identity-ops']
+    assert (compile_('x = [11, 22, 33]\n'
+                     'y = x[:]', passes=passes) ==
+            'p1z 11 p2z 22 p3z 33 p4z 1 '
+            'p6z p4z p7z p6z*10000 p5z p7z+303')
+    assert compile_('x = 1; y = x*1; z = x-0', passes=passes) == 'p1z 1 p2z p1z p3z p1z'
+    assert compile_('x = 1.5; y = x//1', passes=passes) == 'p3z 3 p1z p3z/2 p2z p1z{1'
+
+
+def test_self_assigns():
+    passes = ['fold-identity-ops', 'remove-self-assigns']
+    assert compile_('x = 1; x = x+0', passes=passes) == 'p1z 1'
+    assert compile_('x = 1; x = x*1; x = x*2', passes=passes) == 'p1z 1 p1z p1z*2'
+
+
+def test_coalesce_temporaries():
+    passes = ['coalesce-temporaries']
+    assert compile_('x = 3; y = x < 5', passes=passes) == 'p1z 3 p2z 0 # p1z < 5 ( p2z 1 )'
+    assert compile_('x = 1; y = x + 2 + 3', passes=passes) == 'p1z 1 p2z p1z+2 p2z p2z+3'
+    assert compile_('x = 1; y = 2; z = x + y * 2', passes=passes) == 'p1z 1 p2z 2 p3z p2z*2 p3z p1z+p3z'
+    assert compile_('x = 1; y = 1 - x', passes=passes) == 'p1z 1 p2z 1 p2z p2z-p1z'
+
+    # Variable is read after the temporary is computed
+    assert compile_('x = 1; x = 1 - x', passes=passes) == 'p1z 1 p2z 1 p1z p2z-p1z'
+    assert compile_('x = 1; x = x + 2 + x', passes=passes) == 'p1z 1 p2z p1z+2 p1z p2z+p1z'
+
+    # Loop index is read more than once
+    assert (compile_('x = 0\n'
+                     'for i in range(3):\n'
+                     '    x += i', passes=passes) ==
+            'p1z 0 p3z -1 :1 p3z p3z+1 # p3z >= 3 ( g2z ) p2z p3z*1 p2z p2z+0 p1z p1z+p2z g1z :2')
+
+    # Temporary may be left unchanged by a conditional write
+    assert (compile_('x = 3; y = 0\n'
+                     'while x:\n'
+                     '    y = x < 5', passes=passes) ==
+            'p1z 3 p2z 0 :1 # p1z = 0 ( g2z ) p2z 0 # p1z < 5 ( p2z 1 ) g1z :2')
+
+
+def test_slot_numbers():
+    passes = ['renumber-slots']
+    source = '\n'.join('v{0} = {0}'.format(i) for i in range(12))
+    assert (compile_(source + '\nv11 += v11', passes=passes) ==
+            'p2z 0 p3z 1 p4z 2 p5z 3 p6z 4 p7z 5 p8z 6 p9z 7 p10z 8 p11z 9 p12z 10 '
+            'p1z 11 p1z p1z+p1z')
+
+    # List items stay in place
+    assert (compile_('x = 1; x = 2; xs = [1, 2]; y = xs[x]', passes=passes) ==
+            'p1z 1 p1z 2 p2z 1 p3z 2 p4z 2 p5z p4z+p1z p6z p^5z p7z p6z')
+
+
+def test_budget():
+    module = compile_module('x = 1\n' + 'x = 123456789\n' * 100, opt_level='s')
+    check_budget(module)
+
+    module = compile_module('x = 1\n' + 'x = 123456789\n' * 1000, 'test.py', opt_level='s')
+    with pytest.raises(ValueError) as exc_info:
+        check_budget(module)
+    assert 'scenario does not fit in a map: 14005 characters (limit 10000)' in str(exc_info.value)
+    assert '  test.py:2: 14' in str(exc_info.value)
+    assert exc_info.value._porcupy_lineno == 2
+    assert exc_info.value._porcupy_filename == 'test.py'
@@ -0,0 +1,64 @@
+import pstats
+import threading
+
+from porcupy.compiler import NodeConverter, compile as compile_
+from porcupy.profiler import Profiler
+from porcupy.types import NumberType
+
+
+def test_profiler(tmpdir):
+    visitors = NodeConverter.visitors
+    bin_op = NumberType._bin_op
+
+    profiler = Profiler()
+    with profiler.instrument():
+        compile_('x = 1\n'
+                 'y = x * 2 + 3\n'
+                 'z = randint(1, 5)\n'
+                 'print("{}".format(y))\n')
+    assert NodeConverter.visitors is visitors
+    assert NumberType._bin_op is bin_op
+
+    calls = {stats.name: stats.calls for stats in profiler.sorted_stats('calls')}
+    assert calls['NodeConverter.visit_Assign'] == 3
+    assert calls['NodeConverter.visit_Name'] == 4
+    # randint() scales a random number with another operation
+    assert calls['NumberType._bin_op'] == 3
+    assert calls['Formatter.vformat'] == 1
+    assert calls['randint._call'] == 1
+    assert calls['GameObjectMethod._call'] == 1
+    assert calls['check_func_args'] == 3
+
+    # Module visitor runs everything else
+    first = profiler.sorted_stats()[0]
+    assert first.name == 'NodeConverter.visit_Module'
+    assert first.total_time >= sum(stats.own_time for stats in profiler.stats.values()) * 0.99
+    assert 'NodeConverter.visit_Module' in profiler.format_report(limit=1)
+
+    path = str(tmpdir.join('compile.prof'))
+    profiler.dump(path)
+    stats = pstats.Stats(path)
+    assert stats.total_calls == sum(calls.values())
+
+
+def test_threads():
+    source = 'x = 1\ny = x * 2 + 3\n'
+    expected = compile_(source)
+    results = []
+
+    def compile_in_thread():
+        results.append(compile_(source))
+
+    profiler = Profiler()
+    with profiler.instrument():
+        compile_('x = 1')
+        # Compilations in other threads are not profiled
+        threads = [threading.Thread(target=compile_in_thread) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    assert results == [expected] * 4
+    calls = {stats.name: stats.calls for stats in profiler.sorted_stats('calls')}
+    assert calls['NodeConverter.visit_Assign'] == 1
+    assert 'NumberType._bin_op' not in calls
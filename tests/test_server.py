@@ -0,0 +1,90 @@
+import io
+import json
+
+from porcupy.server import Server, read_message
+
+
+def request(method, request_id=None, **params):
+    message = {'jsonrpc': '2.0', 'method': method, 'params': params}
+    if request_id is not None:
+        message['id'] = request_id
+    body = json.dumps(message).encode('utf-8')
+    return b'Content-Length: ' + str(len(body)).encode('ascii') + b'\r\n\r\n' + body
+
+
+def serve(*messages):
+    writer = io.BytesIO()
+    Server(io.BytesIO(b''.join(messages)), writer).serve()
+    reader = io.BytesIO(writer.getvalue())
+    responses = []
+    while True:
+        body = read_message(reader)
+        if body is None:
+            return responses
+        responses.append(json.loads(body.decode('utf-8')))
+
+
+def test_compile():
+    responses = serve(
+        request('compile', 1, path='a.py', text='x = 1\ny = x + 2'),
+        request('estimate', 2, path='a.py', text='x = 1\ny = x + 3'),
+        request('check', 3, path='a.py', text='x = 1\ny = z'),
+        request('check', 4, path='a.py', text='x = (1'),
+    )
+    assert [response['id'] for response in responses] == [1, 2, 3, 4]
+
+    result = responses[0]['result']
+    assert result['scenario'] == 'p1z 1 p2z p1z+2'
+    assert result['size'] == {'chars': 15, 'lines': 1, 'max_chars': 10000, 'max_lines': 100}
+    assert result['costs'] == [{'line': 1, 'chars': 6}, {'line': 2, 'chars': 10}]
+    assert result['recompiled'] == [1, 2]
+    assert result['diagnostics'] == []
+
+    result = responses[1]['result']
+    assert 'scenario' not in result
+    assert result['recompiled'] == [2]
+
+    assert responses[2]['result'] == {'diagnostics': [{
+        'path': 'a.py',
+        'line': 2,
+        'severity': 'error',
+        'message': "NameError: name 'z' is not defined",
+    }]}
+    assert responses[3]['result']['diagnostics'][0]['line'] == 1
+
+
+def test_imports(tmpdir):
+    tmpdir.join('lib.py').write('x = 1\n'
+                                'y = 2')
+    path = tmpdir.join('main.py')
+    text = 'import lib\nz = lib.y'
+    path.write(text)
+    [response] = serve(request('compile', 1, path=str(path), text=text))
+    result = response['result']
+    assert result['scenario'] == 'p1z 1 p2z 2 p3z p2z'
+    # Lines of imported modules are not counted
+    assert result['costs'] == [{'line': 2, 'chars': 8}]
+
+
+def test_budget():
+    text = 'x = 1\n' + 'x = 123456789\n' * 1000
+    [response] = serve(request('estimate', 1, path='a.py', text=text, opt_level='s'))
+    result = response['result']
+    assert result['size']['chars'] == 14005
+    [diagnostic] = result['diagnostics']
+    assert diagnostic['severity'] == 'warning'
+    assert diagnostic['line'] == 2
+    assert diagnostic['message'].startswith('ValueError: scenario does not fit in a map')
+
+
+def test_protocol_errors():
+    responses = serve(
+        b'Content-Length: 5\r\n\r\n{nope',
+        request('frobnicate', 1),
+        request('compile', 2, text='x = 1'),
+        request('compile', None, path='a.py', text='x = 1'),
+        request('shutdown', 3),
+        request('compile', 4, path='a.py', text='x = 1'),
+    )
+    assert [response.get('error', {}).get('code') for response in responses] == [-32700, -32601, -32602, None]
+    assert responses[-1] == {'jsonrpc': '2.0', 'id': 3, 'result': None}
@@ -0,0 +1,58 @@
+import pytest
+
+from porcupy.compiler import compile as compile_
+from porcupy.session import Session
+
+
+def test_reuse():
+    session = Session()
+    source = ('x = 1\n'
+              'y = x + 2 + 3\n'
+              'while x < 5:\n'
+              '    x += 1\n'
+              'z = y < 5')
+    assert compile_(source, session=session) == compile_(source)
+    assert session.reused == 0
+    assert session.converted == [1, 2, 3, 5]
+
+    assert compile_(source, session=session) == compile_(source)
+    assert session.reused == 4
+    assert session.converted == []
+
+    # Statements from the first changed one are converted again
+    source = source.replace('x < 5', 'x < 6')
+    assert compile_(source, session=session) == compile_(source)
+    assert session.reused == 2
+    assert session.converted == [3, 5]
+
+    source = source.replace('z = y < 5', 'z = y < 5\nw = [z, z]\nv = w[x]')
+    assert compile_(source, session=session) == compile_(source)
+    assert session.converted == [6, 7]
+
+    # Statements below the inserted line are moved
+    source = 'u = 0\n' + source
+    assert compile_(source, session=session, opt_level='s') == compile_(source, opt_level='s')
+    assert session.reused == 0
+
+    # Several statements on one line
+    session = Session()
+    compile_('x = 1; y = 2', session=session)
+    assert compile_('x = 1; y = 3', session=session) == compile_('x = 1; y = 3')
+    assert session.converted == [1, 1]
+
+
+def test_errors():
+    session = Session()
+    compile_('x = 1\n'
+             'y = 2', session=session)
+    with pytest.raises(NameError) as exc_info:
+        compile_('x = 1\n'
+                 'y = 2\n'
+                 'z = w', session=session)
+    assert exc_info.value._porcupy_lineno == 3
+    assert session.reused == 2
+
+    assert compile_('x = 1\n'
+                    'y = 2\n'
+                    'z = y', session=session) == 'p1z 1 p2z 2 p3z p2z'
+    assert session.reused == 2
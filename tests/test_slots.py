@@ -0,0 +1,39 @@
+import pytest
+
+from porcupy.compiler import Slots
+
+
+def test_slots():
+    slots = Slots(start=1, stop=11)
+    assert [slots.allocate() for _ in range(3)] == [1, 2, 3]
+    assert slots.allocate_many(4) == 4
+    assert slots.is_reserved(7)
+    assert not slots.is_reserved(8)
+    assert not slots.is_reserved(0)
+    assert not slots.is_reserved(11)
+
+    slots.free(2)
+    slots.free(5, 2)
+    assert slots.stats().free == 6
+    assert slots.stats().largest_free_run == 3
+    assert slots.stats().fragmentation == 0.5
+
+    # Lowest free slots are taken first, runs are only taken whole
+    assert slots.allocate_many(3) == 8
+    assert slots.allocate() == 2
+    assert slots.allocate_many(2) == 5
+    assert slots.stats().fragmentation == 0.0
+    with pytest.raises(MemoryError):
+        slots.allocate()
+    with pytest.raises(ValueError):
+        slots.free(2, 20)
+
+    copied = slots.copy()
+    copied.free(1)
+    assert slots.is_reserved(1)
+
+    slots = Slots(start=1, stop=1000)
+    assert slots.allocate_many(500) == 1
+    assert slots.allocate_many(499) == 501
+    with pytest.raises(MemoryError):
+        slots.allocate()
@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+from porcupy.compiler import compile as compile_
+from porcupy.target import Target, find_target
+
+
+def test_target_limits():
+    source = 'x = 1\n' + 'if x:\n    x = 2\n' * 60
+
+    small = Target('small', labels=50)
+    with pytest.raises(ValueError) as exc_info:
+        compile_(source, target=small)
+    assert 'ran out of jump labels' in str(exc_info.value)
+    assert compile_(source, target=Target('big', labels=200))
+
+    source = '\n'.join('x{} = {}'.format(i, i) for i in range(120))
+    with pytest.raises(MemoryError):
+        compile_(source)
+    assert compile_(source, target=Target('big', numeric_slots=200)).endswith('p120z 119')
+
+
+def test_find_target(tmpdir):
+    assert find_target('yozhiks').numeric_slots == 99
+
+    path = tmpdir.join('big.json')
+    path.write(json.dumps({'numeric_slots': 200}))
+    target = find_target(str(path))
+    assert target.numeric_slots == 200
+    assert target.labels == 99
+
+    with pytest.raises(ValueError):
+        find_target('unknown')
+    path.write(json.dumps({'slots': 200}))
+    with pytest.raises(ValueError):
+        find_target(str(path))
+
+    # Limits are checked when the target is loaded
+    for fields, message in [({'line_width': 300}, 'line_width must be an integer from 1 to 255, got 300'),
+                            ({'numeric_slots': 0}, 'numeric_slots must be an integer of at least 1, got 0'),
+                            ({'labels': -1}, 'labels must be an integer of at least 1, got -1'),
+                            ({'max_chars': '100'}, "max_chars must be an integer of at least 1, got '100'"),
+                            ({'tick_budget': 0}, 'tick_budget must be an integer of at least 1, got 0')]:
+        path.write(json.dumps(fields))
+        with pytest.raises(ValueError) as exc_info:
+            find_target(str(path))
+        assert message in str(exc_info.value)
+    path.write(json.dumps({'tick_budget': None, 'line_width': 255}))
+    assert find_target(str(path)).tick_budget is None
@@ -0,0 +1,42 @@
+from concurrent.futures import ThreadPoolExecutor
+import glob
+import os
+import sys
+
+from porcupy.compiler import compile as compile_
+from porcupy.gameobjs import Timer
+
+PLAYGROUND = os.path.join(os.path.dirname(__file__), os.pardir, 'playground')
+
+
+def compile_or_fail(job):
+    source, opt_level = job
+    try:
+        return compile_(source, opt_level=opt_level)
+    except Exception as exc:
+        return type(exc).__name__
+
+
+def test_concurrent_compile():
+    sources = []
+    for path in sorted(glob.glob(os.path.join(PLAYGROUND, '*.py'))):
+        with open(path) as fp:
+            sources.append(fp.read())
+    sources.append('timers[1].start()\n'
+                   'for yozhik in yozhiks[1:3]:\n'
+                   '    yozhik.health = 100')
+    jobs = [(source, opt_level) for source in sources for opt_level in ['0', '2', 's']]
+    expected = list(map(compile_or_fail, jobs))
+
+    # Switch threads often, so that compilations interleave
+    switch_interval = sys.getswitchinterval()
+    sys.setswitchinterval(1e-5)
+    try:
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(compile_or_fail, jobs * 4))
+    finally:
+        sys.setswitchinterval(switch_interval)
+    assert results == expected * 4
+
+    # Compilation leaves shared game objects intact
+    assert Timer.start.metadata == {'abbrev': 'g'}